@@ -19,7 +19,8 @@ import concurrent.futures
 import time
 import pickle
 import os
-from collections import defaultdict
+import heapq
+from collections import defaultdict, deque
 from sys import maxsize
 import numpy as np
 
@@ -38,30 +39,85 @@ from mapper import *
 #Resource Definition
 from nsoc_resource import *
 
+#Solvers
+from solver import *
+from cache_class import *
+from bounds import *
 
-def STEUni(SG,model_name):
+
+def STEUni(SG,model_name,priority='steuni'):
+    #priority decides which ready task goes first:
+    #'steuni'        = the order of the original list scan over the dependency keys (default)
+    #'id'            = lowest task id first
+    #'critical_path' = longest remaining path (by fastest extime) first
+    #'extime'        = longest fastest-extime first
     start_time = time.time()                        #start a timer
-    
-    task_dependency = SG.dependency                 #get the dependency
+
+    g               = SG                            #the graph
+    task_dependency = g.dependency                  #get the dependency
     tasks   = list(task_dependency.keys())          #list of tasks
     SG      = list()                                #list schedule
 
     n_tasks = len(tasks)                            #number of tasks in the original graph
+    position= {t:i for i,t in enumerate(tasks)}     #position of each task in the task list
+    n_deps  = {t:len(task_dependency[t]) for t in tasks}    #number of dependent tasks not yet in SG
 
-    while len(tasks) > 0:                           #while there are tasks that are not scheduled
-        for t in tasks:                             #for each task in tasks
-            dependent_tasks = task_dependency[t]    #get the list of dependent_tasks
-            if len(dependent_tasks) == 0:           #the task is independent
-                SG.append(t)                        #append the task to the schedule
-                tasks.remove(t)                     #remove the task from the task list
-            else:
-                ready = True                        #use a ready variable to identify if the task can be inserted in the schedule
-                for dt in dependent_tasks:          #for each task in the dependent_task list
-                    if dt not in SG:                #if the dependent task is not in SG
-                        ready = False               #the task is not ready to be inserted in SG
-                if ready:                           #if the task is ready
-                    SG.append(t)                    #insert the task in SG
-                    tasks.remove(t)                 #remove the task from the task list
+    if priority == 'steuni':
+        #The original scan visits the unscheduled tasks in list order, pass after pass, and
+        #inserts every task whose dependent tasks are in SG. Removing a task from the list
+        #while iterating skips the task that follows it, which defers it to the next pass.
+        #Ready tasks are kept in two heaps keyed by list position: the ones still ahead of
+        #the scan in this pass, and the ones left for the next pass.
+        nxt     = list(range(1,n_tasks+1))          #next unscheduled position in the list
+        prv     = list(range(-1,n_tasks-1))         #previous unscheduled position in the list
+        current = [position[t] for t in tasks if n_deps[t] == 0]   #ready tasks ahead of the scan
+        later   = list()                            #ready tasks for the next pass
+        cursor  = 0                                 #position of the scan
+        heapq.heapify(current)
+        while len(SG) < n_tasks:
+            if len(current) == 0:                   #end of the pass
+                if len(later) == 0:                 #no ready tasks left, the graph has a cycle
+                    break
+                current,later,cursor = later,list(),0
+                heapq.heapify(current)
+            p = heapq.heappop(current)
+            if p < cursor:                          #the scan has passed this task
+                heapq.heappush(later,p)
+                continue
+            t = tasks[p]
+            SG.append(t)                            #insert the task in SG
+            q = nxt[p]                              #remove the task from the task list
+            if prv[p] >= 0:
+                nxt[prv[p]] = q
+            if q < n_tasks:
+                prv[q] = prv[p]
+            cursor = q + 1                          #the task following the removed one is skipped
+            for s in g.graph[t]:
+                if s in n_deps:
+                    n_deps[s] -= 1
+                    if n_deps[s] == 0:
+                        heapq.heappush(current if position[s] >= cursor else later,position[s])
+    else:
+        if priority == 'id':
+            key = {t:t for t in tasks}
+        elif priority == 'extime':
+            key = {t:-min(g.extime[t].values()) for t in tasks}
+        elif priority == 'critical_path':
+            key = {t:-l for t,l in get_critical_path_lengths(g).items()}
+        else:
+            logging.error('[error] unknown STEUni priority %s',priority)
+            exit()
+        ready   = [(key[t],position[t]) for t in tasks if n_deps[t] == 0]  #ready tasks
+        heapq.heapify(ready)
+        while len(ready) > 0:
+            _,p = heapq.heappop(ready)
+            t = tasks[p]
+            SG.append(t)                            #insert the task in SG
+            for s in g.graph[t]:
+                if s in n_deps:
+                    n_deps[s] -= 1
+                    if n_deps[s] == 0:
+                        heapq.heappush(ready,(key[s],position[s]))
     elapsed_time = time.time() - start_time         #elapsed time
     logging.info('[info] STEUni of %s model took %s seconds',model_name,elapsed_time)
     n_schd = len(SG)                                #number of tasks in the schedule
@@ -69,12 +125,11 @@ def STEUni(SG,model_name):
         logging.info('[error] STEUni step of %s graph has error: original graph has %s tasks, the schedule has %s tasks',model_name,n_tasks,n_schd)
     return SG
 
-def OpMap(SG,task_tensors,model_name):
-    start_time = time.time()                        #start a timer
-
+def opmap_ilp(SG,task_tensors,Nt,cfg,report=None,initial=None):
     #x_ij = binary variable representing mapping of task i on resource j
     #i = {0,1,..,N-1}, N = number of tasks
     #j = {0,1,..,Nt}, Nt = number of tiles, j = Nt represents CPU
+    build   = profile_span('opmap.build')
     ##########################
     #define the model
     ##########################
@@ -83,7 +138,6 @@ def OpMap(SG,task_tensors,model_name):
     #define the variables
     ##########################
     N       = len(SG)       #number of tasks
-    Nt      = n_tiles + 1   #number of resources
     nvars   = N * Nt        #number of variables of the optimization problem
     y       = {i: LpVariable(name=f"y{i}", lowBound=0, upBound=1, cat='Binary') for i in range(nvars)}    #variables of the model
     t       = LpVariable("t",0,maxsize)   #linearazation variable
@@ -104,20 +158,170 @@ def OpMap(SG,task_tensors,model_name):
     ##########################
     model   += t
     ##########################
+    #warm start
+    ##########################
+    if initial is not None:
+        for i in range(nvars):
+            y[i].setInitialValue(initial[i])
+        t.setInitialValue(max([sum([initial[i * Nt + j]*task_tensors[SG[i]] for i in range(N)]) for j in range(Nt)]))
+    end_span(build)
+    ##########################
     #solve the problem
     ##########################
-    status   = model.solve(GUROBI(msg=1))
+    info = solve(model,'opmap',cfg,report,initial is not None)
+    if not info['accepted']:
+        solve_start = time.time()
+        variable    = opmap_heuristic(SG,task_tensors,Nt,cfg['opmap_heuristic'])
+        return variable,record_fallback(info,'heuristic_'+cfg['opmap_heuristic'],time.time() - solve_start,report)
     ##########################
     #extract results
     ##########################
+    extract  = profile_span('opmap.extract')
     variable = {}       #all variables of the optimization problem
-    tiles    = list()   #tiles to which tasks are mapped
-    resources= list()   #resources to which tasks are mapped
-    opmap    = {}       #dictionary to return
     for var in model.variables():
         a = re.findall(r'\d+',var.name)
         if len(a) > 0:
-            variable[int(a[0])] = int(var.value())
+            variable[int(a[0])] = int(round(var.value()))
+    end_span(extract)
+    return variable,info
+
+def opmap_lower_bound(sizes,n_tiles):
+    #LP lower bound of the largest mapped bytes per tile
+    if len(sizes) == 0:
+        return 0
+    return max(sum(sizes) / n_tiles, max(sizes))
+
+def opmap_lpt(sizes,n_tiles):
+    #largest tensor first, each on the tile with the least mapped bytes
+    load  = [(0,j) for j in range(n_tiles)]     #heap of (mapped bytes, tile)
+    tiles = [0] * len(sizes)                    #tile of each task
+    for i in sorted(range(len(sizes)),key=lambda i: -sizes[i]):
+        l,j      = heapq.heappop(load)
+        tiles[i] = j
+        heapq.heappush(load,(l + sizes[i],j))
+    return tiles
+
+def opmap_kk(sizes,n_tiles):
+    #Karmarkar-Karp differencing: every task starts as a partial mapping with its bytes on one
+    #tile, and the two partial mappings with the largest spread are merged by putting the
+    #largest tile of one together with the smallest tile of the other, until one is left
+    partial = list()                            #heap of (-spread, id, loads, tasks per tile)
+    for i in range(len(sizes)):
+        loads = [sizes[i]] + [0] * (n_tiles - 1)
+        tasks = [[i]] + [[] for j in range(n_tiles - 1)]
+        partial.append((-sizes[i],i,loads,tasks))
+    heapq.heapify(partial)
+    n_ids = len(sizes)
+    while len(partial) > 1:
+        _,_,la,ta = heapq.heappop(partial)
+        _,_,lb,tb = heapq.heappop(partial)
+        loads = [la[j] + lb[n_tiles - 1 - j] for j in range(n_tiles)]
+        tasks = [ta[j] + tb[n_tiles - 1 - j] for j in range(n_tiles)]
+        order = sorted(range(n_tiles),key=lambda j: -loads[j])
+        loads = [loads[j] for j in order]
+        tasks = [tasks[j] for j in order]
+        heapq.heappush(partial,(loads[-1] - loads[0],n_ids,loads,tasks))
+        n_ids += 1
+    tiles = [0] * len(sizes)                    #tile of each task
+    for _,_,loads,tasks in partial:
+        for j in range(n_tiles):
+            for i in tasks[j]:
+                tiles[i] = j
+    return tiles
+
+def opmap_local_search(sizes,tiles,n_tiles,max_iter=1000):
+    #move or swap tasks between the most loaded tile and the other tiles while it lowers the
+    #bytes of the most loaded tile. A move or swap of d bytes from tile a to tile b is best
+    #when d is closest to half the difference of their loads, which is found by bisection.
+    sizes   = np.asarray(sizes,dtype=np.float64)
+    tiles   = np.asarray(tiles,dtype=np.int64)
+    load    = np.bincount(tiles,weights=sizes,minlength=n_tiles)
+    for it in range(max_iter):
+        a       = int(np.argmax(load))                  #most loaded tile
+        on_a    = np.flatnonzero(tiles == a)
+        on_a    = on_a[np.argsort(sizes[on_a])]         #tasks on a by size
+        sz_a    = sizes[on_a]
+        best    = None                                  #(new max of the two tiles, task on a, task on b or -1, b)
+        for b in range(n_tiles):
+            diff = load[a] - load[b]
+            if b == a or diff <= 0:
+                continue
+            on_b = np.flatnonzero(tiles == b)
+            #d bytes move from a to b: a move of task i (d = size of i) or a swap of i and k
+            #(d = size of i - size of k), useful for 0 < d < diff
+            cand_k  = np.concatenate(([-1],on_b))
+            base    = np.concatenate(([0.0],sizes[on_b]))
+            pos     = np.searchsorted(sz_a,base + diff / 2.0)
+            for p in [pos - 1,pos]:
+                ok  = (p >= 0) & (p < len(sz_a))
+                pc  = np.clip(p,0,max(len(sz_a) - 1,0))
+                if len(sz_a) == 0:
+                    continue
+                d   = sz_a[pc] - base
+                ok &= (d > 0) & (d < diff)
+                if not ok.any():
+                    continue
+                m   = np.where(ok,np.maximum(load[a] - d,load[b] + d),np.inf)
+                c   = int(np.argmin(m))
+                if best is None or m[c] < best[0]:
+                    best = (m[c],int(on_a[pc[c]]),int(cand_k[c]),b)
+        if best is None:
+            break
+        _,i,k,b   = best
+        tiles[i]  = b
+        load[a]  -= sizes[i]
+        load[b]  += sizes[i]
+        if k >= 0:
+            tiles[k]  = a
+            load[a]  += sizes[k]
+            load[b]  -= sizes[k]
+    return tiles.tolist()
+
+def opmap_heuristic(SG,task_tensors,Nt,method='lpt'):
+    #tile of each task from a heuristic, in the same layout as the ILP variables (the CPU is not used)
+    sizes   = [task_tensors[t] for t in SG]
+    if method == 'lpt':
+        tiles = opmap_lpt(sizes,Nt - 1)
+    elif method == 'kk':
+        tiles = opmap_kk(sizes,Nt - 1)
+    else:
+        logging.error('[error] unknown OpMap heuristic %s',method)
+        exit()
+    tiles    = opmap_local_search(sizes,tiles,Nt - 1)
+    variable = {i: 0 for i in range(len(SG) * Nt)}
+    for i,j in enumerate(tiles):
+        variable[i * Nt + j] = 1
+    return variable
+
+def OpMap(SG,task_tensors,model_name,cfg=None,report=None):
+    start_time = time.time()                        #start a timer
+    cfg        = get_params() if cfg is None else cfg   #hardware configuration
+
+    N       = len(SG)                       #number of tasks
+    Nt      = cfg['n_tiles'] + 1            #number of resources
+    if get_solver('opmap',cfg) == 'heuristic' or cfg['opmap_warm_start']:
+        solve_start = time.time()
+        with profile_span('opmap.heuristic',method=cfg['opmap_heuristic']):
+            variable = opmap_heuristic(SG,task_tensors,Nt,cfg['opmap_heuristic'])
+        info     = record_solve('opmap','heuristic_'+cfg['opmap_heuristic'],'Heuristic',time.time() - solve_start,report)
+    if get_solver('opmap',cfg) != 'heuristic':
+        variable,info = opmap_ilp(SG,task_tensors,Nt,cfg,report,variable if cfg['opmap_warm_start'] else None)
+    #gap of the mapping to the LP lower bound
+    sizes               = [task_tensors[t] for t in SG]
+    tile_bytes          = [0] * Nt
+    for i in range(N):
+        for j in range(Nt):
+            tile_bytes[j] += variable[i * Nt + j] * sizes[i]
+    info['objective']   = max(tile_bytes)
+    info['bound']       = opmap_lower_bound(sizes,Nt - 1)
+    info['gap']         = (info['objective'] - info['bound']) / info['bound'] if info['bound'] > 0 else 0
+    logging.info('[info] OpMap of %s model: largest tile has %s bytes, lower bound %s, gap %s',model_name,info['objective'],info['bound'],info['gap'])
+    ##########################
+    #extract results
+    ##########################
+    tiles    = list()   #tiles to which tasks are mapped
+    resources= list()   #resources to which tasks are mapped
+    opmap    = {}       #dictionary to return
     '''
     for i in range(N):
         b = [variable[i*Nt + j] for j in range(Nt)]
@@ -140,12 +344,32 @@ def OpMap(SG,task_tensors,model_name):
     logging.info('[info] OpMap of %s model took %s seconds',model_name,elapsed_time)
     return opmap
 
-def ActMap(g,task_map,model_name):
+def actmap_greedy(g,global_buffer,reuse,cfg,weight_buffer=()):
+    #knapsack by value density: the bytes saved per byte of spm is the reuse factor of a
+    #tensor and 1 for the weights of a task, so the items with the highest density (largest
+    #first on ties) are pinned while they fit
+    capacity  = cfg['spm_sz_per_tile']                              #in KB
+    variable  = {i: 0 for i in range(len(global_buffer))}           #same layout as the ILP variables
+    wvariable = {k: 0 for k in range(len(weight_buffer))}
+    items     = [(reuse[global_buffer[i]],g.tensor[global_buffer[i]],variable,i) for i in range(len(global_buffer))]
+    items    += [(1,get_weight_size(g,weight_buffer[k]),wvariable,k) for k in range(len(weight_buffer))]
+    for density,size,var,i in sorted(items,key=lambda item: (-item[0],-item[1])):
+        size = size*cfg['bit_precision']/(8*1024.0)                 #in KB
+        if size <= capacity:
+            var[i]      = 1
+            capacity   -= size
+    return variable,wvariable
+
+def ActMap(g,task_map,model_name,cfg=None,report=None):
     start_time = time.time()                        #start a timer
+    cfg        = get_params() if cfg is None else cfg   #hardware configuration
+    bit_precision   = cfg['bit_precision']          #bit precision of the tensors
+    spm_sz_per_tile = cfg['spm_sz_per_tile']        #scratchpad size per tile in KB
 
     task_ids        = [m['task'] for m in task_map if m['resource'] == 'npu']
     task_tiles      = [m['tile'] for m in task_map if m['resource'] == 'npu']
     task_tensors    = [g.tensor[tid] for tid in task_ids]
+    npu_tasks       = set(task_ids)             #membership test of the npu tasks
 
     #create a tile map
     tile_map        = defaultdict(list)
@@ -153,16 +377,18 @@ def ActMap(g,task_map,model_name):
         tile_map[ti].append(ta)
 
     actmap          = list()                #list of tasks whose output are to be mapped to spm
+    wtmap           = list()                #list of tasks whose weights are to be mapped to spm
 
     #for each tile
     for key in tile_map.keys():
+        buffers         = profile_span('actmap.buffers',tile=key)
         global_buffer   = list()            #content of this buffer may be pinned to spm
         local_buffer    = list()            #content of this buffer is always pinned to spm
         tasks           = tile_map[key]     #all tasks mapped to this tile
         reuse           = {}                #reuse factor to incorporate in tensor placement
         for ta in tasks:
             ta_out_nodes            = g.graph[ta]                                               #all output nodes of task ta
-            ta_out_nodes_npu        = np.intersect1d(ta_out_nodes,task_ids)                     #how many of those nodes are on a NPU
+            ta_out_nodes_npu        = set(ta_out_nodes) & npu_tasks                             #how many of those nodes are on a NPU
             ta_out_nodes_resources  = [task_map[taon]['resource'] for taon in ta_out_nodes]     #resources of all output nodes
             ta_out_nodes_tiles      = [task_map[taon]['tile'] for taon in ta_out_nodes]         #tile id of all output nodes
             reuse[ta]               = len(ta_out_nodes_npu)                                     #reuse factor is equal to how many times the task's output is being used
@@ -172,63 +398,106 @@ def ActMap(g,task_map,model_name):
             elif len(np.setdiff1d(ta_out_nodes_tiles,[key])) > 0:   #output of ta is needed for a task on a different npu
                 global_buffer.append(ta)
             else:                                                   #output is needed in the same tile
-                #find all paths from ta to a task in ta_out_nodes
+                #check for a longer path from ta to a task in ta_out_nodes
                 local_spm = True
                 for taon in ta_out_nodes:
-                    all_paths = g.getAllPaths(ta,taon)
-                    for p in all_paths:
-                        if len(p) > 2:
-                            local_spm = False
+                    if g.hasAltPath(ta,taon):
+                        local_spm = False
                 if local_spm:
                     local_buffer.append(ta)
                 else:
                     global_buffer.append(ta)
+        #weights of the tasks compete with the tensors for the spm
+        weight_buffer   = list()
+        if cfg['model_weights']:
+            weight_buffer = [ta for ta in tasks if get_weight_size(g,ta) > 0]
+        end_span(buffers)
+        profile_gauge('actmap.global_buffer',len(global_buffer))
         #solve an optimization problem here
         #x_i = binary variable representing mapping of the tensor of task i to spm or memory
         #i = tasks in the global buffer
-        ##########################
-        #define the model
-        ##########################
-        model   = LpProblem(name='actmap_'+str(key),sense=LpMinimize)  #define the model
-        ##########################
-        #define the variables
-        ##########################
-        N       = len(global_buffer)    #number of elements of the global buffer
-        nvars   = N
-        y       = {i: LpVariable(name=f"y{i}", lowBound=0, upBound=1, cat='Binary') for i in range(nvars)}    #variables of the model
-        ##########################
-        #define the constraints
-        ##########################
-        model += (lpSum([y[i]*g.tensor[global_buffer[i]]*bit_precision/(8*1024.0) for i in range(nvars)]) <= spm_sz_per_tile, 'mapping_constraint')
-        ##########################
-        #define the objective fn
-        ##########################
-        model += (lpSum([(1-y[i])*g.tensor[global_buffer[i]]*reuse[global_buffer[i]]*bit_precision/(8*1024.0) for i in range(nvars)]))
-        ##########################
-        #solve the model
-        ##########################
-        status   = model.solve(GUROBI(msg=1))
-        ##########################
-        #extract the results
-        ##########################
-        variable = {}       #all variables of the optimization problem
-        for var in model.variables():
-            a = re.findall(r'\d+',var.name)
-            if len(a) > 0:
-                variable[int(a[0])] = int(var.value())
+        #w_k = binary variable representing mapping of the weights of task k to spm or memory
+        #k = tasks in the weight buffer
+        if get_solver('actmap',cfg) == 'heuristic':
+            solve_start = time.time()
+            with profile_span('actmap.heuristic',tile=key):
+                variable,wvariable = actmap_greedy(g,global_buffer,reuse,cfg,weight_buffer)
+            record_solve('actmap','heuristic','Heuristic',time.time() - solve_start,report)
+        else:
+            build   = profile_span('actmap.build',tile=key)
+            ##########################
+            #define the model
+            ##########################
+            model   = LpProblem(name='actmap_'+str(key),sense=LpMinimize)  #define the model
+            ##########################
+            #define the variables
+            ##########################
+            N       = len(global_buffer)    #number of elements of the global buffer
+            nvars   = N
+            y       = {i: LpVariable(name=f"y{i}", lowBound=0, upBound=1, cat='Binary') for i in range(nvars)}    #variables of the model
+            nweights= len(weight_buffer)
+            w       = {k: LpVariable(name=f"w{k}", lowBound=0, upBound=1, cat='Binary') for k in range(nweights)}  #weight variables of the model
+            ##########################
+            #define the constraints
+            ##########################
+            model += (lpSum([y[i]*g.tensor[global_buffer[i]]*bit_precision/(8*1024.0) for i in range(nvars)])
+                    + lpSum([w[k]*get_weight_size(g,weight_buffer[k])*bit_precision/(8*1024.0) for k in range(nweights)]) <= spm_sz_per_tile, 'mapping_constraint')
+            ##########################
+            #define the objective fn
+            ##########################
+            model += (lpSum([(1-y[i])*g.tensor[global_buffer[i]]*reuse[global_buffer[i]]*bit_precision/(8*1024.0) for i in range(nvars)])
+                    + lpSum([(1-w[k])*get_weight_size(g,weight_buffer[k])*bit_precision/(8*1024.0) for k in range(nweights)]))
+            end_span(build)
+            ##########################
+            #solve the model
+            ##########################
+            info    = solve(model,'actmap',cfg,report)
+            ##########################
+            #extract the results
+            ##########################
+            if info['accepted']:
+                variable  = {i: int(round(y[i].value())) for i in range(nvars)}       #tensor variables of the optimization problem
+                wvariable = {k: int(round(w[k].value())) for k in range(nweights)}    #weight variables of the optimization problem
+            else:
+                solve_start = time.time()
+                variable,wvariable = actmap_greedy(g,global_buffer,reuse,cfg,weight_buffer)
+                record_fallback(info,'heuristic',time.time() - solve_start,report)
         #assign the variables to local buffer
         for k in variable.keys():
             if variable[k] == 1:
                 local_buffer.append(global_buffer[k])
         actmap += local_buffer
+        for k in wvariable.keys():
+            if wvariable[k] == 1:
+                wtmap.append(weight_buffer[k])
 
     elapsed_time = time.time() - start_time         #elapsed time
     logging.info('[info] ActMap of %s model took %s seconds',model_name,elapsed_time)
-    return actmap
+    return actmap,wtmap
+
+def ipcschd_longest_path(all_tasks,all_tasks_extime,succ):
+    #the earliest start time of each actor is the longest path to it, which is also an
+    #optimal solution of the LP
+    n_deps   = {a: 0 for a in all_tasks}    #number of predecessors not yet visited
+    for a in all_tasks:
+        for d in succ[a]:
+            n_deps[d] += 1
+    variable = {a: 0 for a in all_tasks}    #start time of each actor
+    ready    = deque([a for a in all_tasks if n_deps[a] == 0])
+    while len(ready) > 0:
+        a = ready.popleft()
+        for d in succ[a]:
+            variable[d] = max(variable[d],variable[a] + all_tasks_extime[a])
+            n_deps[d]  -= 1
+            if n_deps[d] == 0:
+                ready.append(d)
+    return variable
 
-def IPCSchd(g,task_order,schd,model_name):
+def IPCSchd(g,task_order,schd,model_name,cfg=None,report=None,extra_constraints=None):
     start_time = time.time()                        #start a timer
+    cfg        = get_params() if cfg is None else cfg   #solver configuration
 
+    build           = profile_span('ipcschd.graph')
     sg              = copy.deepcopy(task_order)
     task_map        = schd.mapping
     dma_times       = schd.dma_times
@@ -245,17 +514,13 @@ def IPCSchd(g,task_order,schd,model_name):
         else:                                   #else
             key = resmap_to + '_' + tilemap_to + '_' + layermap_to  #key is resource_tile
         par_ste_order[key].append(to)           #add the task to the order
-    gc = copy.deepcopy(g)
+    succ = defaultdict(list,{a: list(d) for a,d in g.graph.items()})   #successors of each actor, the graph is not modified
     #add other edges due to steuni
     for key in par_ste_order.keys():            #for all resources
         mapped_tasks = par_ste_order[key]       #mapped tasks
-        if len(mapped_tasks) > 1:               #if there are more than 1 tasks mapped to the resource
-            start_task = mapped_tasks.pop(0)    #get the first task
-            while len(mapped_tasks) > 0:        #still tasks in the mapped tasks
-                end_task = mapped_tasks.pop(0)  #get the next task
-                if end_task not in gc.graph[start_task]:
-                    gc.addEdge(start_task,end_task)
-                start_task = end_task
+        for start_task,end_task in zip(mapped_tasks[:-1],mapped_tasks[1:]):    #consecutive tasks on the resource
+            if end_task not in succ[start_task]:
+                succ[start_task].append(end_task)
     #add comm edges
     all_tasks   = sg                #all computing tasks
     all_tasks.sort()                #sort tasks in ascending order
@@ -263,120 +528,318 @@ def IPCSchd(g,task_order,schd,model_name):
     comm_base_id= max_task_id + 1   #base id of communication task
 
     all_tasks_extime = {}           #execution task of all tasks
+    comm_actors      = {}           #row of dma_times of each communication actor
     #all computation tasks
     for task in all_tasks:          #for each computation task
         all_tasks_extime[task] = schd.ex_end_times[task] - schd.ex_start_times[task]
     #all communication tasks
-    for dtx in dma_times:
-        src = dtx.task['src']
-        dst = dtx.task['dst']
-        ext = dtx.end_time - dtx.start_time
-        if dst is not None:
+    for row,(src,dst,tx_start,tx_end,_) in enumerate(dma_times.rows()):
+        ext = tx_end - tx_start
+        if src is None:
+            #add a communication actor loading the weights of dst
+            all_tasks.append(comm_base_id)
+            comm_actors[comm_base_id] = row
+            all_tasks_extime[comm_base_id] = ext
+            succ[comm_base_id].append(dst)
+            comm_base_id += 1
+        elif dst is not None:
             #add a communication actor
             all_tasks.append(comm_base_id)
+            comm_actors[comm_base_id] = row
             #add execution time of this actor
             all_tasks_extime[comm_base_id] = ext
             #configure the connection
-            if dst not in gc.graph[src]:
-                logging.info('[error] %s is not dependent on %s and dependent list is %s',dst,src,gc.graph[src])
+            if dst not in succ[src]:
+                logging.info('[error] %s is not dependent on %s and dependent list is %s',dst,src,succ[src])
                 exit()
             else:
-                gc.addEdge(src,comm_base_id)
-                gc.addEdge(comm_base_id,dst)
-                gc.graph[src].remove(dst)
+                succ[src].append(comm_base_id)
+                succ[comm_base_id].append(dst)
+                succ[src].remove(dst)
             #make ready for the next communication actor
             comm_base_id += 1
         else:
             all_tasks_extime[src] += ext
     #the graph is created here.
-    #now we use an ILP to solve this, just to see how much improvement we can make
-    ##########################
-    #define the model
-    ##########################
-    model   = LpProblem(name='parschd',sense=LpMinimize)  #define the model
-    ##########################
-    #define the variables
-    ##########################
-    #each variable represents the start time of an actor
-    nvars   = len(all_tasks)    #number of variables = number of tasks
-    y       = {i: LpVariable(name=f"y{i}", lowBound=0, upBound=maxsize) for i in range(nvars)}    #variables of the model
-    t       = LpVariable("t",0,maxsize)   #linearazation variable
-    ##########################
-    #define the constraints
-    ##########################
-    #linearization constraints
-    for i in range(nvars):
-        src   =  all_tasks[i]
-        model += (y[i] + all_tasks_extime[src] - t <= 0, 'linearization_constraint_'+str(i))
-    #dependency constraint
-    for i in range(nvars):
-        src     = all_tasks[i] 
-        edges   = gc.graph[src]
-        for dst in edges:
-            j = all_tasks.index(dst)
-            model += (y[j] - y[i] - all_tasks_extime[src] >= 0, 'extime_constraint_'+str(i)+'_'+str(j))
-    ##########################
-    #define the objective
-    ##########################
-    model   += t
-    ##########################
-    #solve the problem
-    ##########################
-    status   = model.solve(GUROBI(msg=1))
-    ##########################
-    #extract results
-    ##########################
-    variable = {}                   #all variables of the optimization problem
-    for var in model.variables():
-        a = re.findall(r'\d+',var.name)
-        if len(a) > 0:
-            variable[all_tasks[int(a[0])]] = int(var.value())
+    #with only precedence constraints the LP is a longest-path problem on a DAG, which is
+    #solved in one topological pass. Extra constraints need the LP solver.
+    end_span(build)
+    profile_gauge('ipcschd.actors',len(all_tasks))
+    extra_constraints = list() if extra_constraints is None else extra_constraints
+    if len(extra_constraints) == 0:
+        solve_start = time.time()
+        with profile_span('ipcschd.longest_path'):
+            variable = ipcschd_longest_path(all_tasks,all_tasks_extime,succ)
+        record_solve('ipcschd','longest_path','Optimal',time.time() - solve_start,report)
+    elif get_solver('ipcschd',cfg) == 'heuristic':
+        raise ValueError('IPCSchd with extra constraints needs an LP solver, not the heuristic solver')
+    else:
+        ##########################
+        #define the model
+        ##########################
+        build   = profile_span('ipcschd.build')
+        model   = LpProblem(name='parschd',sense=LpMinimize)  #define the model
+        ##########################
+        #define the variables
+        ##########################
+        #each variable represents the start time of an actor
+        nvars   = len(all_tasks)    #number of variables = number of tasks
+        column  = {a: i for i,a in enumerate(all_tasks)}  #column of each actor
+        y       = {i: LpVariable(name=f"y{i}", lowBound=0, upBound=maxsize) for i in range(nvars)}    #variables of the model
+        t       = LpVariable("t",0,maxsize)   #linearazation variable
+        ##########################
+        #define the constraints
+        ##########################
+        #linearization constraints
+        for i in range(nvars):
+            src   =  all_tasks[i]
+            model += (y[i] + all_tasks_extime[src] - t <= 0, 'linearization_constraint_'+str(i))
+        #dependency constraint
+        for i in range(nvars):
+            src     = all_tasks[i] 
+            edges   = succ[src]
+            for dst in edges:
+                j = column[dst]
+                model += (y[j] - y[i] - all_tasks_extime[src] >= 0, 'extime_constraint_'+str(i)+'_'+str(j))
+        #extra constraints, each is called with the model, the start time variable of each actor
+        #and the makespan variable
+        for add_constraint in extra_constraints:
+            add_constraint(model,{a: y[column[a]] for a in all_tasks},t)
+        ##########################
+        #define the objective
+        ##########################
+        model   += t
+        end_span(build)
+        ##########################
+        #solve the problem
+        ##########################
+        info    = solve(model,'ipcschd',cfg,report)
+        ##########################
+        #extract results
+        ##########################
+        variable = {}                   #start time of each actor
+        if info['accepted']:
+            for i in range(nvars):
+                variable[all_tasks[i]] = int(round(y[i].value()))
+        elif info['status'] == 'Infeasible':
+            #no schedule meets the constraints of the caller, the longest path would violate them
+            raise ValueError('IPCSchd of %s model is infeasible with %s extra constraints' % (model_name,len(extra_constraints)))
+        else:
+            #the longest path only keeps the precedence constraints, the extra constraints are dropped
+            solve_start = time.time()
+            variable    = ipcschd_longest_path(all_tasks,all_tasks_extime,succ)
+            fallback    = record_fallback(info,'longest_path',time.time() - solve_start,report)
+            fallback['dropped_constraints'] = len(extra_constraints)
+            logging.warning('[warning] IPCSchd of %s model dropped %s extra constraints, its schedule may violate them',model_name,len(extra_constraints))
     new_start_time  = copy.deepcopy(variable)
     new_end_time    = {}
     for key in new_start_time.keys():
         new_end_time[key] = new_start_time[key] + all_tasks_extime[key]
-    new_schd = copy.deepcopy(schd)                  #copy the original schedule
+    new_schd = schd.derive()                        #shares the mapping and transfers of the original schedule
     new_schd.add_ex_start_times(new_start_time)     #create new start times
     new_schd.add_ex_end_times(new_end_time)         #create new end times
+    new_schd.add_comm_actors(comm_actors)           #transfer of each communication actor
     
     elapsed_time = time.time() - start_time         #elapsed time
     logging.info('[info] IPCSchd of %s model took %s seconds',model_name,elapsed_time)
     return new_schd
 
+def merge_intervals(starts,ends):
+    #merge half-open [start,end) intervals into sorted disjoint intervals
+    starts  = np.asarray(starts,dtype=np.int64)
+    ends    = np.asarray(ends,dtype=np.int64)
+    keep    = ends > starts                         #empty intervals occupy no cycle
+    starts  = starts[keep]
+    ends    = ends[keep]
+    if len(starts) == 0:
+        return starts,ends
+    order   = np.argsort(starts,kind='stable')
+    starts  = starts[order]
+    ends    = np.maximum.accumulate(ends[order])
+    new     = np.ones(len(starts),dtype=bool)       #an interval opens a new group unless it overlaps the running end
+    new[1:] = starts[1:] >= ends[:-1]
+    first   = np.flatnonzero(new)
+    last    = np.append(first[1:] - 1,len(starts) - 1)
+    return starts[first],ends[last]
+
+def overlaps(starts,ends,occ_starts,occ_ends):
+    #check if any interval overlaps the sorted disjoint intervals of occ. The intervals are
+    #checked in chunks of doubling size, most shifts of ParSchd overlap in the first chunk
+    first   = 0
+    chunk   = 64
+    while first < len(starts):
+        s       = starts[first:first + chunk]
+        e       = ends[first:first + chunk]
+        idx     = np.searchsorted(occ_ends,s,side='right')  #first occupied interval ending after the start
+        valid   = idx < len(occ_starts)
+        if np.any(occ_starts[idx[valid]] < e[valid]):
+            return True
+        first  += chunk
+        chunk  *= 2
+    return False
+
 def ParSchd(g,schd,model_name):
     start_time      = time.time()          #start a timer
     all_actors      = schd.ex_start_times.keys()
     maxCompActorID  = g.getMaxNodeId()
     startTimes      = list()
     endTimes        = list()
-    maxDiff         = 0
     batchDelays     = list()
     for a in all_actors:
         if a > maxCompActorID:  #consider only the communication actors
             startTimes.append(schd.ex_start_times[a])
             endTimes.append(schd.ex_end_times[a])
-    maxEndTime      = max(endTimes) + 1
-    linear          = np.zeros(2 * maxEndTime)
-    for st,et in zip(startTimes,endTimes):
-        diff = et - st
-        if diff > maxDiff:
-            maxDiff = diff
-        for i in range(st,et):
-            linear[i] = 1
-    
-    dmaOccupancy= copy.deepcopy(linear)    #this is the dma occupancy
-    shift       = maxDiff
-    while shift < maxEndTime:
-        b       = copy.deepcopy(linear)
-        c       = np.roll(b,shift)
-        d       = dmaOccupancy + c
-        if len(np.where(d == 2)[0]) == 0:
-            batchDelays.append(shift)
-            dmaOccupancy = copy.deepcopy(d)
-        shift   += maxDiff
-    par_schd = copy.deepcopy(schd)
+    if len(endTimes) > 0:
+        maxEndTime  = max(endTimes) + 1
+        maxDiff     = max(0,max([et - st for st,et in zip(startTimes,endTimes)]))
+        busyStarts,busyEnds = merge_intervals(startTimes,endTimes) #this is the dma occupancy of one batch
+        occStarts   = busyStarts
+        occEnds     = busyEnds
+        shift       = maxDiff
+        while maxDiff > 0 and shift < maxEndTime:
+            if not overlaps(busyStarts + shift,busyEnds + shift,occStarts,occEnds):
+                batchDelays.append(shift)
+                occStarts,occEnds = merge_intervals(np.concatenate((occStarts,busyStarts + shift)),np.concatenate((occEnds,busyEnds + shift)))
+            shift   += maxDiff
+    par_schd = schd.derive()
     par_schd.add_batch_delays(batchDelays)
 
     elapsed_time = time.time() - start_time         #elapsed time
     logging.info('[info] ParSchd of %s model took %s seconds',model_name,elapsed_time)
     return par_schd
+
+def get_npu_task_order(g,task_order,cfg):
+    #the tasks of task_order that are supported on the NPU
+    filtered_task_order = list()
+    for task in task_order:
+        if g.ltype[task] in cfg['NPU_SUPPORTED_OPERATIONS'] or len(cfg['NPU_SUPPORTED_OPERATIONS']) == 0:
+            filtered_task_order.append(task)
+    return filtered_task_order
+
+def apply_opmap(start_map,opmap):
+    #copy of the task map with the resource and tile of each task from OpMap
+    task_ids    = {m['task']:i for i,m in enumerate(start_map)}
+    opmap_map   = copy.deepcopy(start_map)
+    for key in opmap.keys():
+        opmap_map[task_ids[key]]['resource']= opmap[key]['resource']
+        opmap_map[task_ids[key]]['tile']    = opmap[key]['tile']
+    return opmap_map
+
+def apply_actmap(opmap_map,actmap,wtmap):
+    #copy of the task map with the tensors and weights ActMap pins to the spm
+    task_ids    = {m['task']:i for i,m in enumerate(opmap_map)}
+    actmap_map  = copy.deepcopy(opmap_map)
+    for task in actmap:
+        actmap_map[task_ids[task]]['tensor']   = 'spm'
+    for task in wtmap:
+        actmap_map[task_ids[task]]['weight']   = 'spm'
+    return actmap_map
+
+def cached_stage(cache,model_name,stage,parts,fn):
+    #output of fn and its cache key, fn only runs if the output is not in the cache
+    with profile_span(stage,model=model_name):
+        if cache is None:
+            return fn(),None
+        key     = cache.key(stage,*parts)
+        value   = cache.get(key)
+        if value is None:
+            profile_count('cache.misses')
+            value = fn()
+            cache.put(key,value)
+        else:
+            profile_count('cache.hits')
+            logging.info('[info] %s of %s model loaded from the stage cache',stage,model_name)
+        return value,key
+
+def write_stage(trace_writer,stage,schd):
+    #stream the schedule of a stage to the trace as soon as it is done
+    if trace_writer is not None:
+        trace_writer.write_stage(stage,schd)
+
+def SMARTFlow(g,model_name,cfg=None,engine='thread',priority='steuni',cache=None,task_rank=None,trace_writer=None):
+    #task_rank optionally ranks the tasks, tasks of a lower rank go first in the STEUni order.
+    #trace_writer optionally writes the schedule of each stage to a columnar trace
+    cfg         = get_params() if cfg is None else cfg  #hardware configuration
+    gkey        = get_graph_hash(g) if cache is not None else None     #graph part of the cache keys
+    hw_params   = get_stage_params(cfg,'list_scheduler')
+    order_key   = priority if task_rank is None else (priority,sorted(task_rank.items()))
+
+    flow        = profile_span('SMARTFlow',model=model_name)
+    profile_gauge('graph.tasks',len(g.dependency))
+
+    #STEUni, the wall time of each stage includes its list scheduling, or its cache lookup
+    stage_start = time.time()
+    with profile_span('steuni',model=model_name):
+        task_order  = STEUni(g,model_name,priority)
+    if task_rank is not None:       #stable, tasks of one rank keep their STEUni order
+        task_order = sorted(task_order,key=lambda t: task_rank[t])
+    start_map   = mapper(g,cfg)
+    steuni_schd,_ = cached_stage(cache,model_name,'steuni_schd',(gkey,order_key,engine,hw_params),
+                                 lambda: list_scheduler(g,task_order,start_map,model_name,engine,cfg))
+    steuni_schd.add_runtime(time.time() - stage_start)
+    write_stage(trace_writer,'steuni',steuni_schd)
+
+    #OpMap
+    stage_start = time.time()
+    filtered_task_order = get_npu_task_order(g,task_order,cfg)
+    task_tensors= g.tensor
+    def run_opmap():
+        opmap_report = list()
+        return OpMap(filtered_task_order,task_tensors,model_name,cfg,opmap_report),opmap_report
+    (opmap,opmap_report),opmap_key = cached_stage(cache,model_name,'opmap',(gkey,order_key,get_stage_params(cfg,'opmap')),run_opmap)
+    opmap_map   = apply_opmap(start_map,opmap)
+    opmap_schd,_ = cached_stage(cache,model_name,'opmap_schd',(gkey,order_key,engine,hw_params,opmap_key),
+                                lambda: list_scheduler(g,task_order,opmap_map,model_name,engine,cfg))
+    opmap_schd.add_solver_info(opmap_report)
+    opmap_schd.add_runtime(time.time() - stage_start)
+    write_stage(trace_writer,'opmap',opmap_schd)
+
+    #ActMap
+    stage_start = time.time()
+    def run_actmap():
+        actmap_report = list()
+        return ActMap(g,opmap_map,model_name,cfg,actmap_report),actmap_report
+    ((actmap,wtmap),actmap_report),actmap_key = cached_stage(cache,model_name,'actmap',(gkey,get_stage_params(cfg,'actmap'),opmap_key),run_actmap)
+    actmap_map  = apply_actmap(opmap_map,actmap,wtmap)
+    actmap_schd,actmap_schd_key = cached_stage(cache,model_name,'actmap_schd',(gkey,order_key,engine,hw_params,actmap_key),
+                                               lambda: list_scheduler(g,task_order,actmap_map,model_name,engine,cfg))
+    actmap_schd.add_solver_info(actmap_report)
+    actmap_schd.add_runtime(time.time() - stage_start)
+    write_stage(trace_writer,'actmap',actmap_schd)
+    if cfg['pe_prefetch']:          #the same mappings without prefetch, for the gain of the prefetch
+        base_cfg    = dict(cfg,pe_prefetch=False)
+        base_params = get_stage_params(base_cfg,'list_scheduler')
+        for stage,schd,stage_map,map_key in [('opmap',opmap_schd,opmap_map,opmap_key),('actmap',actmap_schd,actmap_map,actmap_key)]:
+            base_schd,_ = cached_stage(cache,model_name,stage+'_schd',(gkey,order_key,engine,base_params,map_key),
+                                       lambda: list_scheduler(g,task_order,stage_map,model_name,engine,base_cfg))
+            log_prefetch_gain(schd,base_schd,model_name,stage)
+
+    #STEPar
+    stage_start = time.time()
+    with profile_span('stepar',model=model_name):
+        stepar_schd = actmap_schd.derive()
+    stepar_schd.add_runtime(time.time() - stage_start)
+    write_stage(trace_writer,'stepar',stepar_schd)
+
+    #IPCSchd
+    stage_start = time.time()
+    def run_ipcschd():
+        ipc_report  = list()
+        ipc_schd    = IPCSchd(g,task_order,stepar_schd,model_name,cfg,ipc_report)
+        ipc_schd.add_solver_info(ipc_report)
+        return ipc_schd
+    ipc_schd,ipc_key= cached_stage(cache,model_name,'ipcschd',(gkey,order_key,get_stage_params(cfg,'ipcschd'),actmap_schd_key),run_ipcschd)
+    ipc_schd.add_runtime(time.time() - stage_start)
+    write_stage(trace_writer,'ipcschd',ipc_schd)
+
+    #ParSchd
+    stage_start     = time.time()
+    par_schd,_      = cached_stage(cache,model_name,'parschd',(gkey,ipc_key),lambda: ParSchd(g,ipc_schd,model_name))
+    par_schd.add_runtime(time.time() - stage_start)
+    write_stage(trace_writer,'parschd',par_schd)
+
+    schedule_dict   = {'steuni':steuni_schd, 'opmap':opmap_schd, 'actmap':actmap_schd, 'stepar':stepar_schd, 'ipcschd':ipc_schd, 'parschd':par_schd}
+    with profile_span('bounds',model=model_name):
+        add_stage_bounds(cfg,g,schedule_dict,model_name)
+    end_span(flow)
+    return schedule_dict
@@ -0,0 +1,93 @@
+'''
+Copyright © 2023 Prof. Anup Das
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+Author      : Anup Das
+Date        : July 02, 2023
+Version     : 2.0
+Description : This is the class definition of a channel arbiter. It grants a set of dma or
+mem channels to pending transfer requests, and is shared by the threaded and the
+discrete-event resources.
+'''
+
+import logging
+
+ARBITRATION_POLICIES = ['fifo','round_robin','priority']
+
+def get_channel_config(cfg,kind):
+    #(tx granularity, clock period) of each channel of kind 'dma' or 'mem'
+    n_channels  = cfg['n_'+kind+'_channels']
+    granularity = cfg[kind+'_channel_tx_granularity']
+    clock       = cfg[kind+'_channel_clock_periods']
+    granularity = [cfg[kind+'_tx_granularity']] * n_channels if granularity is None else list(granularity)
+    clock       = [cfg[kind+'_clock_period']] * n_channels if clock is None else list(clock)
+    if len(granularity) != n_channels or len(clock) != n_channels:
+        logging.error('[error] %s channel granularity and clock periods need %s entries',kind,n_channels)
+        exit()
+    return list(zip(granularity,clock))
+
+class Arbiter:
+    """
+    Class to grant n channels to transfer requests. fifo serves the oldest request,
+    round_robin rotates between the requesting pes and priority serves the request with
+    the highest priority first (the critical path length of the task it serves).
+    """
+    def __init__(self,name,n_channels,policy='fifo'):
+        if policy not in ARBITRATION_POLICIES:
+            logging.error('[error] unknown channel arbitration policy %s',policy)
+            exit()
+        if n_channels < 1:
+            logging.error('[error] %s needs at least one channel',name)
+            exit()
+        self.name       = name                  #'Mem' or 'DMA'
+        self.n_channels = n_channels            #number of channels
+        self.policy     = policy                #arbitration policy
+        self.free       = [True] * n_channels   #status of each channel
+        self.waiting    = list()                #pending requests (ticket, requester, priority, allowed channels)
+        self.granted    = {}                    #channel granted to each ticket, until the ticket takes it
+        self.seq        = 0                     #ticket of the next request, in arrival order
+        self.requesters = list()                #requesters in the order they were first seen, for round robin
+        self.last       = -1                    #index of the last requester served, for round robin
+
+    def request(self,requester=None,priority=0,allowed=None):
+        #register a request and return its ticket
+        ticket      = self.seq
+        self.seq   += 1
+        allowed     = list(range(self.n_channels)) if allowed is None else allowed
+        if requester not in self.requesters:
+            self.requesters.append(requester)
+        self.waiting.append((ticket,requester,priority,allowed))
+        return ticket
+
+    def pick(self,candidates):
+        #select the request to serve next among the ones with a free channel
+        if self.policy == 'fifo':
+            return min(candidates,key=lambda r: r[0])
+        elif self.policy == 'priority':
+            return min(candidates,key=lambda r: (-r[2],r[0]))
+        #round robin, the first requester after the last one served
+        n = len(self.requesters)
+        return min(candidates,key=lambda r: ((self.requesters.index(r[1]) - self.last - 1) % n,r[0]))
+
+    def grant(self):
+        #grant free channels to waiting requests, returns the list of (ticket, channel) granted
+        grants = list()
+        while True:
+            candidates = [r for r in self.waiting if any(self.free[c] for c in r[3])]
+            if len(candidates) == 0:
+                break
+            r       = self.pick(candidates)
+            channel = [c for c in r[3] if self.free[c]][0]  #lowest free channel allowed for the request
+            self.free[channel]  = False
+            self.waiting.remove(r)
+            self.last           = self.requesters.index(r[1])
+            self.granted[r[0]]  = channel
+            grants.append((r[0],channel))
+        return grants
+
+    def release(self,channel):
+        self.free[channel] = True
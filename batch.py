@@ -0,0 +1,100 @@
+'''
+Copyright © 2023 Prof. Anup Das
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+Author      : Anup Das
+Date        : July 02, 2023
+Version     : 2.0
+Description : This is a batch runner for a zoo of models. The models are run through the full
+SMART flow, each in its own process, with a time limit per model. A model that fails, crashes
+its process or times out does not stop the others, the schedules of each model are saved to results/<model>.pkl and the
+completion times and runtimes of all models are written to one summary table.
+'''
+#Headers
+import logging
+import time
+import os
+import glob
+import fnmatch
+
+#Configuration Parameters
+from params import *
+
+#Sweep helpers
+from sweep import *
+
+def get_models(patterns,model_root='models',exclude=()):
+    #model names from names, glob patterns or paths of model directories. A model that matches
+    #a pattern of exclude is only run if it is named exactly
+    models = list()
+    for pattern in patterns:
+        target  = os.path.basename(os.path.normpath(pattern))
+        matches = sorted(glob.glob(os.path.join(model_root,target)))
+        names   = [os.path.basename(m) for m in matches if os.path.isdir(m)]
+        names   = [name for name in names if name == target or not any([fnmatch.fnmatch(name,e) for e in exclude])]
+        if len(names) == 0:
+            logging.error('[error] no model directory in %s matches %s',model_root,pattern)
+        for name in names:
+            if name not in models:
+                models.append(name)
+    return models
+
+def batch(models,overrides=None,engine='event',workers=None,timeout=None,cache_dir=None,results_dir='results'):
+    rows        = list()
+    start_time  = time.time()
+    overrides   = {} if overrides is None else overrides   #parameters shared by all models
+    jobs        = [(model_name,overrides,engine,cache_dir,timeout,os.path.join(results_dir,model_name+'.pkl')) for model_name in models]
+    for n,(i,row) in enumerate(run_isolated(jobs,workers,timeout)):
+        elapsed = time.time() - start_time
+        logging.info('[info] Model %s/%s (%s) %s in %s seconds, %s seconds elapsed',n+1,len(jobs),row['model'],row['status'],row.get('runtime'),elapsed)
+        rows.append(row)
+    rows.sort(key=lambda row: models.index(row['model']))
+    return rows
+
+def log_summary(rows):
+    logging.info('[info] %-20s %-10s %s %s','model','status',' '.join(['%12s' % stage for stage in STAGES]),'runtime')
+    for row in rows:
+        times   = ' '.join(['%12s' % (('%.1f' % row[stage]) if stage in row else '-') for stage in STAGES])
+        runtime = ('%.1f' % row['runtime']) if 'runtime' in row else '-'
+        logging.info('[info] %-20s %-10s %s %s',row['model'],row['status'][:10],times,runtime)
+    logging.info('[info] Wall time of each stage in seconds')
+    logging.info('[info] %-20s %s','model',' '.join(['%12s' % stage for stage in STAGES]))
+    for row in rows:
+        times   = ' '.join(['%12s' % (('%.2f' % row[stage+'_runtime']) if row.get(stage+'_runtime') is not None else '-') for stage in STAGES])
+        logging.info('[info] %-20s %s',row['model'],times)
+    n_ok        = len([row for row in rows if row['status'] == 'ok'])
+    n_timeout   = len([row for row in rows if row['status'] == 'timeout'])
+    logging.info('[info] %s models: %s ok, %s timed out, %s failed',len(rows),n_ok,n_timeout,len(rows) - n_ok - n_timeout)
+
+if __name__ == "__main__":
+    #Arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-models','--models',nargs='+',default=['*'],help='model names, glob patterns or directories under models/')
+    parser.add_argument('-exclude','--exclude',nargs='*',default=['synth_*'],help='patterns of models left out unless named exactly, the generated models by default')
+    parser.add_argument('-params','--params',nargs='*',default=[],help='parameter values as key=value')
+    parser.add_argument('-workers','--workers',type=int,default=None)
+    parser.add_argument('-timeout','--timeout',type=float,default=None,help='time limit of a model in seconds')
+    parser.add_argument('-engine','--engine',default='event',choices=['thread','event'])
+    parser.add_argument('-cache','--cache',default=None,help='stage cache directory, no cache if not set')
+    parser.add_argument('-out','--out',default='results/batch.csv')
+    parser.add_argument('-fname','--fname',default='batch.log')
+    args = vars(parser.parse_args())
+
+    format = "[%(asctime)s]: %(message)s"
+    handlers = [logging.FileHandler(args['fname']), logging.StreamHandler()]
+    logging.basicConfig(format=format, level=logging.INFO,datefmt="%H:%M:%S",handlers = handlers)
+
+    start_time  = time.time()
+    models      = get_models(args['models'],exclude=args['exclude'])
+    overrides   = {key:values[0] for key,values in parse_grid(args['params']).items()}
+    logging.info('[info] Running %s models: %s',len(models),models)
+    rows        = batch(models,overrides,args['engine'],args['workers'],args['timeout'],args['cache'])
+    write_table(rows,args['out'])
+    log_summary(rows)
+    elapsed     = time.time() - start_time
+    logging.info('[info] Batch of %s models took %s seconds, summary written to %s',len(rows),elapsed,args['out'])
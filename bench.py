@@ -0,0 +1,147 @@
+'''
+Copyright © 2023 Prof. Anup Das
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+Author      : Anup Das
+Date        : July 02, 2023
+Version     : 2.0
+Description : This is the scaling benchmark. It runs each stage of the SMART flow on synthetic
+models of growing size, records the wall time and peak memory of every stage, and stores them
+as json so that a later run can be compared against it for regressions.
+'''
+#Headers
+import logging
+import time
+import json
+import ast
+import os
+import platform
+import subprocess
+import tracemalloc
+
+#Configuration Parameters
+from params import *
+
+#Helper fns
+from helper_fns import *
+from scheduler import *
+from mapper import *
+
+#Import the design flow
+import SMART
+from bounds import *
+from synth import *
+
+def measure(timings,stage,fn,memory=True,quiet=True):
+    #runs fn, appends its wall time and peak memory to timings and returns its value. The info
+    #lines of the stage are dropped when quiet, the per-task lines would dominate its time
+    if memory:
+        tracemalloc.reset_peak()
+    if quiet:
+        logging.disable(logging.INFO)
+    start_time  = time.perf_counter()
+    try:
+        value   = fn()
+    finally:
+        logging.disable(logging.NOTSET)
+    elapsed     = time.perf_counter() - start_time
+    peak        = tracemalloc.get_traced_memory()[1] / (1024 * 1024) if memory else None
+    timings.append({'stage':stage,'time':elapsed,'peak_mb':peak})
+    return value
+
+def bench_model(model_name,cfg,engine='event',memory=True,model_root='models'):
+    #wall time and peak memory of each stage of the flow on one model
+    timings = list()
+    g           = measure(timings,'read',lambda: read_graph_data(model_name,model_root=model_root),memory)
+    task_order  = measure(timings,'steuni',lambda: SMART.STEUni(g,model_name),memory)
+    start_map   = measure(timings,'mapper',lambda: mapper(g,cfg),memory)
+    measure(timings,'steuni_schd',lambda: list_scheduler(g,task_order,start_map,model_name,engine,cfg),memory)
+    npu_order   = SMART.get_npu_task_order(g,task_order,cfg)
+    opmap       = measure(timings,'opmap',lambda: SMART.OpMap(npu_order,g.tensor,model_name,cfg),memory)
+    opmap_map   = SMART.apply_opmap(start_map,opmap)
+    measure(timings,'opmap_schd',lambda: list_scheduler(g,task_order,opmap_map,model_name,engine,cfg),memory)
+    actmap,wtmap= measure(timings,'actmap',lambda: SMART.ActMap(g,opmap_map,model_name,cfg),memory)
+    actmap_map  = SMART.apply_actmap(opmap_map,actmap,wtmap)
+    actmap_schd = measure(timings,'actmap_schd',lambda: list_scheduler(g,task_order,actmap_map,model_name,engine,cfg),memory)
+    ipc_schd    = measure(timings,'ipcschd',lambda: SMART.IPCSchd(g,task_order,actmap_schd,model_name,cfg),memory)
+    measure(timings,'parschd',lambda: SMART.ParSchd(g,ipc_schd,model_name),memory)
+    measure(timings,'bounds',lambda: get_bounds(cfg,g,actmap_map,'actmap'),memory)
+    return timings
+
+def get_run_info():
+    #where and on what the benchmark ran
+    try:
+        commit = subprocess.run(['git','rev-parse','HEAD'],capture_output=True,text=True,cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {'time':time.strftime('%Y-%m-%d %H:%M:%S'),'python':platform.python_version(),
+            'machine':platform.machine(),'processor':platform.processor(),'commit':commit}
+
+def bench(families,sizes,cfg,engine='event',seed=0,memory=True,model_root='models'):
+    results = list()
+    if memory:
+        tracemalloc.start()
+    for family in families:
+        for n_nodes in sizes:
+            model_name  = make_model(family,n_nodes,seed,model_root)
+            for timing in bench_model(model_name,cfg,engine,memory,model_root):
+                timing.update({'family':family,'n_nodes':n_nodes})
+                results.append(timing)
+                logging.info('[info] bench %-12s %8s %-12s %10.4f s %s MB',family,n_nodes,timing['stage'],timing['time'],
+                             '-' if timing['peak_mb'] is None else '%.1f' % timing['peak_mb'])
+    if memory:
+        tracemalloc.stop()
+    return results
+
+def compare(results,baseline,threshold=1.2,min_time=0.01):
+    #stages that got slower than threshold times the baseline, ignoring stages faster than min_time
+    base        = {(r['family'],r['n_nodes'],r['stage']):r for r in baseline['results']}
+    regressions = list()
+    for r in results:
+        key = (r['family'],r['n_nodes'],r['stage'])
+        if key not in base or max(r['time'],base[key]['time']) < min_time:
+            continue
+        ratio = r['time'] / base[key]['time'] if base[key]['time'] > 0 else float('inf')
+        if ratio > threshold:
+            regressions.append((key,base[key]['time'],r['time'],ratio))
+            logging.info('[info] Regression of %s %s %s: %s s -> %s s (%.2fx)',*key,base[key]['time'],r['time'],ratio)
+    logging.info('[info] %s regressions against the baseline of %s',len(regressions),baseline['info'].get('commit'))
+    return regressions
+
+if __name__ == "__main__":
+    #Arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-families','--families',nargs='+',default=FAMILIES,choices=FAMILIES)
+    parser.add_argument('-sizes','--sizes',nargs='+',type=int,default=[100,1000,10000,100000])
+    parser.add_argument('-params','--params',nargs='*',default=["solver='heuristic'"],help='parameter values as key=value')
+    parser.add_argument('-engine','--engine',default='event',choices=['thread','event'])
+    parser.add_argument('-seed','--seed',type=int,default=0)
+    parser.add_argument('-root','--root',default='models',help='directory of the model directories')
+    parser.add_argument('-no_memory','--no_memory',action='store_true',help='do not trace the peak memory, which slows down the stages')
+    parser.add_argument('-out','--out',default='results/bench.json')
+    parser.add_argument('-compare','--compare',default=None,help='json of an earlier run to compare against')
+    parser.add_argument('-threshold','--threshold',type=float,default=1.2,help='slowdown reported as a regression')
+    parser.add_argument('-fname','--fname',default='bench.log')
+    args = vars(parser.parse_args())
+
+    format = "[%(asctime)s]: %(message)s"
+    handlers = [logging.FileHandler(args['fname']), logging.StreamHandler()]
+    logging.basicConfig(format=format, level=logging.INFO,datefmt="%H:%M:%S",handlers = handlers)
+
+    overrides   = {}
+    for arg in args['params']:
+        key,value       = arg.split('=',1)
+        overrides[key]  = ast.literal_eval(value)
+    cfg         = get_params(overrides)
+    results     = bench(args['families'],args['sizes'],cfg,args['engine'],args['seed'],not args['no_memory'],args['root'])
+    report      = {'info':get_run_info(),'params':overrides,'engine':args['engine'],'results':results}
+    with open(args['out'],'w') as f:
+        json.dump(report,f,indent=1)
+    logging.info('[info] Benchmark results written to %s',args['out'])
+    if args['compare'] is not None:
+        compare(results,json.load(open(args['compare'])),args['threshold'])
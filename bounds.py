@@ -0,0 +1,111 @@
+'''
+Copyright © 2023 Prof. Anup Das
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+Author      : Anup Das
+Date        : July 02, 2023
+Version     : 2.0
+Description : These are the analytical lower bounds of a schedule. For the mapping of a stage,
+the completion time is at least the critical path of the mapped execution times, the work of
+the busiest pe, and the time to move all dma and mem traffic over the channels. The gap of
+each stage to the largest of these bounds shows how much a better solve could still gain.
+'''
+
+import logging
+
+from arbiter_class import *
+from helper_fns import *
+
+#bounds that hold for the completion time of each stage. The list schedules model every
+#transfer on the channels. IPCSchd keeps the execution times and the order of the tasks on each
+#pe but does not arbitrate the channels, and the ParSchd completion time is the interval
+#between batches, which is bounded by the pe work of one batch
+STAGE_BOUNDS = {
+    'steuni'    : ['critical_path','resource_work','dma_bandwidth','mem_bandwidth'],
+    'opmap'     : ['critical_path','resource_work','dma_bandwidth','mem_bandwidth'],
+    'actmap'    : ['critical_path','resource_work','dma_bandwidth','mem_bandwidth'],
+    'stepar'    : ['critical_path','resource_work','dma_bandwidth','mem_bandwidth'],
+    'ipcschd'   : ['critical_path','resource_work'],
+    'parschd'   : ['resource_work'],
+}
+
+def get_pe_key(m):
+    #pe of a task mapping, as in get_par_ste_order
+    return 'cpu' if m['resource'] == 'cpu' else m['resource']+'_'+str(m['tile'])+'_'+m['name']
+
+def critical_path_bound(g,task_map):
+    #longest path with the execution time of each task on its mapped resource
+    resource    = {m['task']:m['resource'] for m in task_map}
+    length      = {}
+    for t in g.getTopologicalOrder():
+        head        = [length[d] for d in g.dependency[t] if d in length]
+        length[t]   = g.extime[t][resource[t]] + (max(head) if len(head) > 0 else 0)
+    return max(length.values()) if len(length) > 0 else 0
+
+def resource_work_bound(g,task_map):
+    #execution time of all tasks mapped to the busiest pe
+    work = {}
+    for m in task_map:
+        key         = get_pe_key(m)
+        work[key]   = work.get(key,0) + g.extime[m['task']][m['resource']]
+    return max(work.values()) if len(work) > 0 else 0
+
+def transfer_volumes(cfg,g,task_map):
+    #total size moved over the dma and mem channels, with the transfers of the pes
+    tensor_locs = {m['task']:m['tensor'] for m in task_map}
+    weight_locs = {m['task']:m.get('weight','mem') for m in task_map}
+    volume      = {'dma':0,'mem':0}
+    for m in task_map:
+        t       = m['task']
+        on_cpu  = m['resource'] == 'cpu'
+        #inputs, a mem tensor goes over mem to the cpu and over dma to the npu, a spm tensor
+        #goes over dma to the cpu only
+        for tr in g.dependency[t]:
+            if tensor_locs[tr] == 'mem':
+                volume['mem' if on_cpu else 'dma'] += g.tensor[tr]
+            elif on_cpu:
+                volume['dma'] += g.tensor[tr]
+        #output
+        if tensor_locs[t] == 'mem':
+            volume['mem' if on_cpu else 'dma'] += g.tensor[t]
+        elif on_cpu:
+            volume['dma'] += g.tensor[t]
+        #weights
+        weights = get_transferred_weights(cfg,g,get_pe_key(m),t,weight_locs)
+        if weights > 0:
+            volume['mem' if on_cpu and weight_locs[t] == 'mem' else 'dma'] += weights
+    return volume
+
+def bandwidth_bound(cfg,volume,kind):
+    #time to move volume over all channels of kind 'dma' or 'mem' in parallel
+    bandwidth = sum([granularity / clock for granularity,clock in get_channel_config(cfg,kind)])
+    return volume / bandwidth
+
+def get_bounds(cfg,g,task_map,stage):
+    #lower bounds of the completion time of a stage, and the largest of them
+    volume      = transfer_volumes(cfg,g,task_map)
+    all_bounds  = {
+        'critical_path' : lambda: critical_path_bound(g,task_map),
+        'resource_work' : lambda: resource_work_bound(g,task_map),
+        'dma_bandwidth' : lambda: bandwidth_bound(cfg,volume['dma'],'dma'),
+        'mem_bandwidth' : lambda: bandwidth_bound(cfg,volume['mem'],'mem'),
+    }
+    bounds = {name:all_bounds[name]() for name in STAGE_BOUNDS[stage]}
+    bounds['lower_bound'] = max(bounds.values())
+    return bounds
+
+def add_stage_bounds(cfg,g,schedule_dict,model_name):
+    #attach the bounds to the schedule of each stage and log the gaps
+    for stage,schd in schedule_dict.items():
+        if stage not in STAGE_BOUNDS:
+            continue
+        schd.add_bounds(get_bounds(cfg,g,schd.mapping,stage))
+        gap = schd.get_gap()        #None if the lower bound is 0
+        logging.info('[info] %s of %s model: completion time %s, lower bound %s, gap %s (%s)',stage,model_name,schd.get_completion_time(),schd.bounds['lower_bound'],gap,
+                     ', '.join(['%s %s' % (name,value) for name,value in schd.bounds.items() if name != 'lower_bound']))
+        if gap is not None and gap < 0:     #only ParSchd, which shifts batches by their dma occupancy alone
+            logging.info('[info] %s of %s model is below its lower bound, the batches overlap on the pes',stage,model_name)
@@ -0,0 +1,143 @@
+'''
+Copyright © 2023 Prof. Anup Das
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+Author      : Anup Das
+Date        : July 02, 2023
+Version     : 2.0
+Description : This is the class definition of the stage cache. The output of each stage of
+the SMART flow is stored on disk under a hash of its inputs, so that a stage is only
+recomputed when the graph, its parameters, an upstream stage or the code changes.
+'''
+
+import glob
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+from solver import *
+
+#version of the cache layout, bump it when the stored values change
+CACHE_VERSION = 2
+
+#parameters each stage depends on, in addition to the outputs of its upstream stages.
+#the list schedulers depend on all hardware parameters, i.e. everything except the
+#solver and opmap settings
+STAGE_PARAMS = {
+    'opmap'     : ['n_tiles','NPU_SUPPORTED_OPERATIONS','opmap_heuristic','opmap_warm_start'],
+    'actmap'    : ['spm_sz_per_tile','bit_precision','model_weights'],
+    'ipcschd'   : [],
+    'parschd'   : [],
+}
+
+#stages whose output depends on the solver settings, IPCSchd without extra constraints does not
+SOLVER_STAGES = ['opmap','actmap']
+
+code_version = None     #hash of the source files, computed once per process
+
+def is_solver_param(key):
+    return key.startswith('solver') or key.startswith('opmap_')
+
+def is_trace_param(key):
+    return key.startswith('trace_')
+
+def get_stage_params(cfg,stage):
+    #sorted (key, value) pairs of the parameters a stage depends on
+    if stage not in STAGE_PARAMS:          #list scheduler, the trace does not change the schedule
+        return sorted([(key,cfg[key]) for key in cfg.keys() if not is_solver_param(key) and not is_trace_param(key)])
+    params = sorted([(key,cfg[key]) for key in STAGE_PARAMS[stage]])
+    if stage in SOLVER_STAGES:
+        options = get_solver_options(cfg,stage)
+        del options['msg']                  #verbosity does not change the result
+        params += sorted(options.items()) + [('resolved_solver',get_solver(stage,cfg))]
+    return params
+
+def get_code_version():
+    #hash of all python sources next to this file
+    global code_version
+    if code_version is None:
+        h = hashlib.sha256()
+        for fname in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)),'*.py'))):
+            h.update(os.path.basename(fname).encode())
+            with open(fname,'rb') as f:
+                h.update(f.read())
+        code_version = h.hexdigest()
+    return code_version
+
+class StageCache:
+    """
+    Class to store stage outputs on disk, keyed by a hash of the stage inputs. The least
+    recently used entries are evicted when the cache grows beyond max_size bytes.
+    """
+    def __init__(self,root='cache',max_size=1024*1024*1024):
+        self.root       = root          #cache directory
+        self.max_size   = max_size      #in bytes
+        self.hits       = 0
+        self.misses     = 0
+        os.makedirs(self.root,exist_ok=True)
+
+    def key(self,stage,*parts):
+        return hashlib.sha256(repr((CACHE_VERSION,get_code_version(),stage,parts)).encode()).hexdigest()
+
+    def path(self,key):
+        return os.path.join(self.root,key[:2],key+'.pkl')
+
+    def get(self,key):
+        #stored value, or None if the key is not in the cache
+        fname = self.path(key)
+        try:
+            with open(fname,'rb') as f:
+                value = pickle.load(f)
+        except (OSError,EOFError,pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        os.utime(fname)                 #mark the entry as recently used
+        self.hits += 1
+        return value
+
+    def put(self,key,value):
+        fname = self.path(key)
+        os.makedirs(os.path.dirname(fname),exist_ok=True)
+        fd,tmp_name = tempfile.mkstemp(dir=os.path.dirname(fname),suffix='.tmp')
+        with os.fdopen(fd,'wb') as f:
+            pickle.dump(value,f)
+        os.replace(tmp_name,fname)      #concurrent writers of the same key store the same value
+        self.evict()
+
+    def entries(self):
+        #(last use, size, file name) of all entries
+        entries = list()
+        for fname in glob.glob(os.path.join(self.root,'*','*.pkl')):
+            try:
+                st = os.stat(fname)
+            except OSError:
+                continue
+            entries.append((st.st_mtime,st.st_size,fname))
+        return entries
+
+    def evict(self):
+        entries = sorted(self.entries())
+        size    = sum([e[1] for e in entries])
+        while size > self.max_size and len(entries) > 0:
+            _,sz,fname = entries.pop(0)
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+            size -= sz
+            logging.info('[info] Evicted %s from the stage cache',os.path.basename(fname))
+
+    def clear(self):
+        entries = self.entries()
+        for _,_,fname in entries:
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+        logging.info('[info] Cleared %s entries from the stage cache',len(entries))
@@ -0,0 +1,58 @@
+'''
+Copyright © 2023 Prof. Anup Das
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+Author      : Anup Das
+Date        : July 02, 2023
+Version     : 2.0
+Description : This is the class definition of a simulation context. It owns the state that the
+scheduler and the nsoc resources share during one simulation.
+'''
+
+from threading import Condition
+
+#Configuration Parameters
+from params import get_params
+
+from arbiter_class import *
+from recorder_class import *
+
+class SimulationContext:
+    """
+    Class to hold the state of one simulation, so that several schedules can run
+    concurrently in one process
+    """
+    def __init__(self,cfg=None):
+        self.cfg = get_params() if cfg is None else cfg     #hardware configuration of this simulation
+        self.recorder = EventRecorder(self.cfg['trace_level'],self.cfg['trace_buffer'])    #events of the simulation
+        self.reset()
+
+    def reset(self,tasks=()):
+        self.dma_arbiter        = Arbiter('DMA',self.cfg['n_dma_channels'],self.cfg['channel_arbitration'])    #DMA channels
+        self.mem_arbiter        = Arbiter('Mem',self.cfg['n_mem_channels'],self.cfg['channel_arbitration'])    #memory channels
+        self.dma_channels       = get_channel_config(self.cfg,'dma')   #(granularity, clock period) of each DMA channel
+        self.mem_channels       = get_channel_config(self.cfg,'mem')   #(granularity, clock period) of each memory channel
+        self.channel_cond       = Condition()   #guards the arbiters in the threaded resources
+        self.task_priority      = {}            #arbitration priority of the transfers of each task
+        self.prefetched_tasks   = list()        #tasks whose inputs were prefetched before they were dispatched
+        self.spm_pinned         = {}            #kb of the spm of each tile pinned by the mapping
+        self.completion_status  = {}            #task status
+        self.cpu_cycles         = 0             #cpu cycles
+        self.task_start_times   = {}            #start times of execution
+        self.task_end_times     = {}            #end times of execution
+        self.dma_times          = list()        #dma start times
+        self.mem_times          = list()        #mem start times
+        self.recorder.clear()
+        for t in tasks:
+            self.completion_status[t] = 0
+
+    def dma_allowed(self,pe_type):
+        #dma channels a pe can use, None for all of them
+        if self.cfg['dma_channel_binding'] == 'tile' and 'npu' in pe_type:
+            tile = int(pe_type.split('_')[1])
+            return [tile % self.cfg['n_dma_channels']]
+        return None
@@ -0,0 +1,219 @@
+'''
+Copyright © 2023 Prof. Anup Das
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+Author      : Anup Das
+Date        : July 02, 2023
+Version     : 2.0
+Description : This is the co-scheduling flow. Several models that run concurrently on one NSoC
+are merged into one graph, which goes through the SMART flow as a whole. A batch is the
+co-scheduling of several copies of one model. Models can have a
+priority and a deadline or period. Tasks of a model with a higher priority, and then with an
+earlier deadline, go first in the STEUni order. The latency of each model against its deadline
+and the aggregate throughput are reported.
+'''
+#Headers
+import logging
+import time
+import pickle
+import numpy as np
+
+#Configuration Parameters
+from params import *
+
+#Helper fns
+from helper_fns import *
+from graph_class import *
+
+#Import the design flow
+import SMART
+from cache_class import *
+
+def get_model_labels(model_names):
+    #unique label of each model, a model that appears more than once gets its index appended
+    return [name if model_names.count(name) == 1 else name+'_'+str(i) for i,name in enumerate(model_names)]
+
+def merge_graphs(graphs):
+    #one graph with the nodes of all graphs, and the task ids of each graph in it
+    g           = Graph(0)
+    model_tasks = list()
+    for graph in graphs:
+        shift   = g.addGraph(graph)
+        model_tasks.append([u + shift for u in graph.dependency.keys()])
+    return g,model_tasks
+
+def get_cosched_report(schedule_dict,labels,model_tasks,priorities,deadlines,periods):
+    #latency of each model in the IPCSchd schedule, all models start at cycle 0, and the
+    #throughput of the ParSchd schedule
+    ipc_schd    = schedule_dict['ipcschd']
+    interval    = schedule_dict['parschd'].get_completion_time()   #cycles between iterations of all models
+    rows        = list()
+    for i,label in enumerate(labels):
+        end     = max([ipc_schd.ex_end_times[u] for u in model_tasks[i]])
+        row     = {'model':label,'priority':priorities[i],'deadline':deadlines[i],'period':periods[i],
+                   'latency':end,'throughput':1.0 / interval if interval > 0 else 0}
+        row['deadline_met'] = deadlines[i] is None or end <= deadlines[i]
+        row['period_met']   = periods[i] is None or interval <= periods[i]
+        rows.append(row)
+    return {'models':rows,'interval':interval,'throughput':len(labels) / interval if interval > 0 else 0}
+
+def get_makespan(schedule_dict):
+    return max(schedule_dict['ipcschd'].ex_end_times.values())
+
+def get_steady_state(makespans,tolerance):
+    #interval between inferences once the pes are saturated: the makespan each inference adds
+    #between batches of k and 2k inferences, for the first k where it changes by less than
+    #tolerance from the k before. The copies of a small batch overlap, so their makespan hardly
+    #grows, and the makespan per inference keeps shrinking until the batch saturates the pes
+    sizes       = sorted(makespans.keys())
+    slopes      = [(k2,(makespans[k2] - makespans[k1]) / (k2 - k1)) for k1,k2 in zip(sizes[:-1],sizes[1:])]
+    for (k1,s1),(k2,s2) in zip(slopes[:-1],slopes[1:]):
+        if s1 > 0 and s2 > 0 and abs(s2 - s1) <= tolerance * s2:
+            return s2,k2,True
+    if len(slopes) == 0:
+        return None,sizes[-1],False
+    return slopes[-1][1],slopes[-1][0],False
+
+def get_batch_report(schedule_dict,single_dict,model_tasks,makespans,tolerance=0.05):
+    #latency of each inference of the batch schedule, and the steady-state interval from the
+    #makespans of growing batches, against the interval ParSchd estimates from one inference
+    ipc_schd    = schedule_dict['ipcschd']
+    starts      = [min([ipc_schd.ex_start_times[u] for u in tasks]) for tasks in model_tasks]
+    ends        = [max([ipc_schd.ex_end_times[u] for u in tasks]) for tasks in model_tasks]
+    latencies   = [end - start for start,end in zip(starts,ends)]
+    makespan    = max(ends)
+    spacing     = np.diff(sorted(ends))                 #spacing of consecutive completions
+    interval,steady_copies,converged = get_steady_state(makespans,tolerance)
+    estimate    = single_dict['parschd'].get_completion_time()
+    valid       = interval is not None and interval > 0
+    #the estimate is only compared with a converged interval
+    return {'latencies':latencies,'makespan':makespan,'mean_interval':makespan / len(model_tasks),
+            'completion_spacing':float(np.median(spacing)) if len(spacing) > 0 else 0,
+            'makespans':makespans,'interval':interval,'steady_copies':steady_copies,'converged':converged,
+            'throughput':1.0 / interval if valid else 0,'parschd_interval':estimate,
+            'parschd_error':(estimate - interval) / interval if valid and converged else None}
+
+def get_batch_sizes(n_copies,max_copies):
+    #batches of 2, 4, 8, ... inferences up to max_copies, and the batch of n_copies
+    return sorted(set([2 ** i for i in range(1,max_copies.bit_length())] + [n_copies]))
+
+def BatchFlow(model_name,n_copies,cfg=None,engine='event',priority='steuni',cache=None,max_copies=None,tolerance=0.05):
+    #schedules n_copies inferences of a model end to end, one inference for the ParSchd
+    #estimate, and batches of 2, 4, 8, ... inferences, up to max_copies (n_copies if None),
+    #until the makespan each inference adds converges to the steady-state interval
+    start_time      = time.time()
+    max_copies      = n_copies if max_copies is None else max_copies
+    g               = read_graph_data(model_name)
+    batch_g,model_tasks = merge_graphs([g] * n_copies)
+    batch_name      = model_name+'_x'+str(n_copies)
+    logging.info('[info] Scheduling a batch of %s inferences of %s model with %s tasks',n_copies,model_name,len(batch_g.dependency))
+    single_dict     = SMART.SMARTFlow(g,model_name,cfg,engine,priority,cache)
+    schedule_dict   = SMART.SMARTFlow(batch_g,batch_name,cfg,engine,priority,cache)
+    makespans       = {1:get_makespan(single_dict)}     #makespans of batches of 1, 2, 4, ... inferences
+    for k in get_batch_sizes(n_copies,max_copies):
+        if get_steady_state(makespans,tolerance)[2]:
+            break
+        if k == n_copies:
+            makespans[k] = get_makespan(schedule_dict)
+        else:
+            k_g,_   = merge_graphs([g] * k)
+            makespans[k] = get_makespan(SMART.SMARTFlow(k_g,model_name+'_x'+str(k),cfg,engine,priority,cache))
+        logging.info('[info] Makespan of a batch of %s inferences of %s model: %s cycles',k,model_name,makespans[k])
+    report          = get_batch_report(schedule_dict,single_dict,model_tasks,makespans,tolerance)
+    elapsed         = time.time() - start_time
+    logging.info('[info] Batch scheduling of %s took %s seconds',batch_name,elapsed)
+    return schedule_dict,report
+
+def log_batch_report(report):
+    latencies = report['latencies']
+    logging.info('[info] Batch of %s inferences: makespan %s cycles, latency mean %s max %s cycles',len(latencies),report['makespan'],sum(latencies) / len(latencies),max(latencies))
+    logging.info('[info] Average makespan per inference %s cycles, median spacing of completions %s cycles',report['mean_interval'],report['completion_spacing'])
+    if not report['converged']:
+        logging.info('[info] The makespan per added inference did not converge up to batches of %s inferences, the steady-state interval is the last estimate (raise -max_copies)',report['steady_copies'])
+    logging.info('[info] Steady-state interval %s cycles at %s inferences (throughput %s inferences per cycle), ParSchd estimate %s cycles (error %s)',report['interval'],report['steady_copies'],report['throughput'],report['parschd_interval'],report['parschd_error'])
+
+def CoSchedFlow(model_names,cfg=None,engine='thread',priority='steuni',cache=None,priorities=None,deadlines=None,periods=None):
+    #priorities, deadlines and periods have one entry per model, None for no constraint. A model
+    #with a period and no deadline must end within its period
+    start_time  = time.time()
+    n_models    = len(model_names)
+    priorities  = [None] * n_models if priorities is None else priorities
+    deadlines   = [None] * n_models if deadlines is None else deadlines
+    periods     = [None] * n_models if periods is None else periods
+    if not (len(priorities) == len(deadlines) == len(periods) == n_models):
+        logging.error('[error] co-scheduling needs one priority, deadline and period per model')
+        exit()
+    labels      = get_model_labels(model_names)
+    graphs      = [read_graph_data(model_name) for model_name in model_names]
+    g,model_tasks = merge_graphs(graphs)
+    cosched_name= '+'.join(labels)
+
+    #rank of the tasks of each model, by priority and then earliest deadline. IPCSchd starts
+    #every task as early as the resource order allows, so the order is what a deadline changes
+    latency_bounds  = [d if d is not None else p for d,p in zip(deadlines,periods)]
+    task_rank       = None
+    if any([p is not None for p in priorities + latency_bounds]):
+        task_rank = {}
+        for i in range(n_models):
+            rank = (-(priorities[i] or 0),float('inf') if latency_bounds[i] is None else latency_bounds[i])
+            for u in model_tasks[i]:
+                task_rank[u] = rank
+    logging.info('[info] Co-scheduling %s models with %s tasks: %s',n_models,len(g.dependency),labels)
+
+    schedule_dict   = SMART.SMARTFlow(g,cosched_name,cfg,engine,priority,cache,task_rank)
+    report          = get_cosched_report(schedule_dict,labels,model_tasks,priorities,latency_bounds,periods)
+    elapsed         = time.time() - start_time
+    logging.info('[info] Co-scheduling of %s took %s seconds',cosched_name,elapsed)
+    return schedule_dict,report
+
+def log_cosched_report(report):
+    logging.info('[info] %-20s %8s %12s %12s %12s %s','model','priority','latency','deadline','period','met')
+    for row in report['models']:
+        met = 'yes' if row['deadline_met'] and row['period_met'] else 'no'
+        logging.info('[info] %-20s %8s %12s %12s %12s %s',row['model'],row['priority'],row['latency'],row['deadline'],row['period'],met)
+    logging.info('[info] Iteration interval %s cycles, aggregate throughput %s inferences per cycle',report['interval'],report['throughput'])
+
+def parse_optional(values,n_models,name):
+    #per-model values of an argument, 'none' for no value
+    if values is None:
+        return [None] * n_models
+    if len(values) != n_models:
+        logging.error('[error] -%s needs one value per model',name)
+        exit()
+    return [None if v.lower() == 'none' else float(v) for v in values]
+
+if __name__ == "__main__":
+    #Arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-models','--models',nargs='+',required=True,help='models running concurrently')
+    parser.add_argument('-priorities','--priorities',nargs='+',default=None,help='priority of each model, higher goes first, none for no priority')
+    parser.add_argument('-deadlines','--deadlines',nargs='+',default=None,help='latency bound of each model in cycles, none for no bound')
+    parser.add_argument('-periods','--periods',nargs='+',default=None,help='period of each model in cycles, none for no period')
+    parser.add_argument('-engine','--engine',default='thread',choices=['thread','event'])
+    parser.add_argument('-priority','--priority',default='steuni',choices=['steuni','id','critical_path','extime'])
+    parser.add_argument('-cache','--cache',default=None,help='stage cache directory, no cache if not set')
+    parser.add_argument('-fname','--fname',default='cosched.log')
+    args = vars(parser.parse_args())
+
+    format = "[%(asctime)s]: %(message)s"
+    handlers = [logging.FileHandler(args['fname']), logging.StreamHandler()]
+    logging.basicConfig(format=format, level=logging.INFO,datefmt="%H:%M:%S",handlers = handlers)
+
+    model_names = args['models']
+    n_models    = len(model_names)
+    priorities  = parse_optional(args['priorities'],n_models,'priorities')
+    deadlines   = parse_optional(args['deadlines'],n_models,'deadlines')
+    periods     = parse_optional(args['periods'],n_models,'periods')
+    cache       = StageCache(args['cache']) if args['cache'] is not None else None
+
+    schedule_dict,report = CoSchedFlow(model_names,get_params(),args['engine'],args['priority'],cache,priorities,deadlines,periods)
+
+    #save the results
+    ofname      = 'results/'+'+'.join(get_model_labels(model_names))+'.pkl'
+    pickle.dump({'schedules':schedule_dict,'report':report},open(ofname,'wb'))
+    log_cosched_report(report)
@@ -0,0 +1,248 @@
+'''
+Copyright © 2023 Prof. Anup Das
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+Author      : Anup Das
+Date        : July 02, 2023
+Version     : 2.0
+Description : This is a discrete-event implementation of the nsoc resources. It models the
+same pe, mem and dma semantics as nsoc_resource.py, but time is advanced by an event heap
+keyed by simulated time instead of a wall-clock loop.
+'''
+#Headers
+import heapq
+import logging
+from collections import defaultdict, deque
+from math import ceil
+
+from schedule_class import *
+from helper_fns import *
+
+#Configuration Parameters
+from params import *
+
+class EventQueue:
+    """
+    Class to hold the pending events ordered by simulated time
+    """
+    def __init__(self):
+        self.now    = 0         #current simulated time
+        self.events = list()    #heap of (time, sequence, fn, args)
+        self.seq    = 0         #sequence number to break ties in insertion order
+
+    def schedule(self,delay,fn,*args):
+        heapq.heappush(self.events,(self.now + delay,self.seq,fn,args))
+        self.seq += 1
+
+    def run(self):
+        while len(self.events) > 0:
+            self.now,_,fn,args = heapq.heappop(self.events)
+            fn(*args)
+        return self.now
+
+class Channel:
+    """
+    Class to model the mem or dma channels. The arbiter grants a free channel to the
+    pending requests, so one channel with fifo arbitration serves them in order, which is
+    what the single channel of the threaded resources provides.
+    """
+    def __init__(self,eq,name,arbiter,channels,times,recorder):
+        self.eq             = eq                #event queue
+        self.name           = name              #'Mem' or 'DMA'
+        self.arbiter        = arbiter           #grants channels to requests
+        self.channels       = channels          #(granularity in bits, clock period) of each channel
+        self.times          = times             #list of completed transfers
+        self.recorder       = recorder          #events of the simulation
+        self.pending        = {}                #transfer of each ticket waiting for a channel
+
+    def request(self,size,task,dst,callback,requester=None,priority=0,allowed=None,i=None):
+        #callback is called with i when the transfer finishes
+        ticket                  = self.arbiter.request(requester,priority,allowed)
+        self.pending[ticket]    = (size,task,dst,callback,i)
+        self.dispatch()
+
+    def dispatch(self):
+        for ticket,channel in self.arbiter.grant():
+            self.arbiter.granted.pop(ticket)
+            self.start(channel,*self.pending.pop(ticket))
+
+    def start(self,channel,size,task,dst,callback,i):
+        #a transfer without a source task loads the weights of dst
+        tx_granularity,clock_period = self.channels[channel]
+        header      = {'src':task,'dst':dst}        #transfer header
+        s           = MemorySchedule(header)        #create empty schedule
+        s.set_channel(channel)                      #channel of the transfer
+        s.set_start_time(self.eq.now)               #set the start time of the schedule
+        if self.recorder.transfers:
+            self.recorder.record(self.eq.now,'weight_start' if task is None else 'transfer_start',self.name,dst if task is None else task,channel)
+        tx_time     = size / tx_granularity * clock_period      #total number of clock cycles needed for this transfer
+        self.eq.schedule(ceil(tx_time),self.finish,s,callback,i)
+
+    def finish(self,s,callback,i):
+        s.set_end_time(self.eq.now)                 #set the end time of the schedule
+        if self.recorder.transfers:
+            self.recorder.record(self.eq.now,'weight_end' if s.task['src'] is None else 'transfer_end',self.name,s.task['dst'] if s.task['src'] is None else s.task['src'])
+        self.times.append(s)                        #append the schedule to the list of transactions
+        self.arbiter.release(s.channel)             #release the channel
+        self.dispatch()
+        callback(i)
+
+class PE:
+    """
+    Class to model a processing element. Tasks are fired in the given order: fetch all
+    inputs, execute, write the output back and then mark the task as completed. With
+    prefetch, an npu pe fetches the inputs of its next task while the current task
+    executes, if both fit in the scratchpad of the tile.
+    """
+    def __init__(self,engine,pe_type,task_list):
+        self.engine     = engine
+        self.pe_type    = pe_type
+        self.task_list  = task_list
+        self.idx        = 0     #index of the current task in the task list
+        self.busy       = False #the current task is executing or writing back
+        self.pending    = {}    #number of dependencies / transfers each prepared task waits for
+        self.ready      = set() #prepared tasks whose inputs have arrived
+        self.prefetch   = engine.ctx.cfg['pe_prefetch'] and 'npu' in pe_type
+
+    def next_task(self):
+        if self.idx == len(self.task_list):
+            return
+        if self.idx in self.ready:          #inputs were prefetched, and arrived before the task was dispatched
+            self.engine.ctx.prefetched_tasks.append(self.task_list[self.idx])
+            self.execute(self.idx)
+        elif self.idx not in self.pending:  #not prepared yet
+            self.prepare(self.idx)
+
+    def prepare(self,i):
+        e = self.engine
+        t = self.task_list[i]
+        #check if all its dependent tasks are ready
+        #if not, wait for them to notify this pe
+        self.pending[i] = 0
+        for dt in e.g.dependency[t]:
+            if e.ctx.completion_status[dt] == 0:
+                e.waiters[dt].append((self,i))
+                self.pending[i] += 1
+        if self.pending[i] == 0:
+            self.fetch_inputs(i)
+
+    def dependency_done(self,i):
+        self.pending[i] -= 1
+        if self.pending[i] == 0:
+            self.fetch_inputs(i)
+
+    def fetch_inputs(self,i):
+        e = self.engine
+        t = self.task_list[i]
+        transfers = e.input_transfers(self.pe_type,t)
+        weights   = get_transferred_weights(e.ctx.cfg,e.g,self.pe_type,t,e.weight_locs)   #size of the weights to load
+        wchannel  = e.channel(self.pe_type,e.weight_locs.get(t,'mem'))
+        if weights > 0 and wchannel is not None:
+            transfers.append((wchannel,None))
+        self.pending[i] = len(transfers)
+        if self.pending[i] == 0:
+            self.inputs_ready(i)
+        for channel,tr in transfers:
+            size = weights if tr is None else e.g.tensor[tr]
+            channel.request(size,tr,t,self.input_done,*e.arbitration(self.pe_type,channel,t),i=i)
+
+    def input_done(self,i):
+        self.pending[i] -= 1
+        if self.pending[i] == 0:
+            self.inputs_ready(i)
+
+    def inputs_ready(self,i):
+        del self.pending[i]
+        if i == self.idx and not self.busy:
+            self.execute(i)
+        else:                               #prefetched while the previous task runs
+            self.ready.add(i)
+
+    def execute(self,i):
+        e = self.engine
+        t = self.task_list[i]
+        self.ready.discard(i)
+        self.busy       = True
+        task_resource   = self.pe_type.split('_')[0]    #task's resource = cpu or npu
+        task_extime     = e.g.extime[t][task_resource]  #task's extime
+        if e.ctx.recorder.tasks:
+            e.ctx.recorder.record(e.eq.now,'task_start',self.pe_type,t,task_extime)
+        e.ctx.task_start_times[t] = e.eq.now
+        e.eq.schedule(ceil(task_extime),self.save_output,i)
+        if self.prefetch and i + 1 < len(self.task_list) and fits_spm(e.ctx.cfg,e.g,self.pe_type,t,self.task_list[i + 1],e.tensor_locs,e.weight_locs,e.ctx.spm_pinned):
+            if e.ctx.recorder.tasks:
+                e.ctx.recorder.record(e.eq.now,'prefetch',self.pe_type,self.task_list[i + 1])
+            self.prepare(i + 1)
+
+    def save_output(self,i):
+        e = self.engine
+        t = self.task_list[i]
+        e.ctx.task_end_times[t] = e.eq.now
+        if e.ctx.recorder.tasks:
+            e.ctx.recorder.record(e.eq.now,'task_end',self.pe_type,t)
+        channel = e.channel(self.pe_type,e.tensor_locs[t])
+        if channel is None:
+            self.complete(i)
+        else:
+            channel.request(e.g.tensor[t],t,None,self.complete,*e.arbitration(self.pe_type,channel,t),i=i)
+
+    def complete(self,i):
+        e = self.engine
+        t = self.task_list[i]
+        e.ctx.completion_status[t] = 1      #update the status of the task as completed
+        for pe,j in e.waiters.pop(t,[]):    #notify the pes waiting on this task
+            pe.dependency_done(j)
+        self.busy   = False
+        self.idx   += 1
+        self.next_task()
+
+class EventEngine:
+    """
+    Class to simulate a set of pes sharing the mem and dma channels. The results are
+    written to the simulation context.
+    """
+    def __init__(self,ctx,g,tensor_locs,weight_locs=None):
+        self.ctx                = ctx                   #simulation state, filled in as events are processed
+        self.g                  = g
+        self.tensor_locs        = tensor_locs
+        self.weight_locs        = {} if weight_locs is None else weight_locs
+        self.eq                 = EventQueue()
+        self.waiters            = defaultdict(list)     #(pe, index of the task in its list) waiting for the completion of a task
+        self.mem_channel        = Channel(self.eq,'Mem',ctx.mem_arbiter,ctx.mem_channels,ctx.mem_times,ctx.recorder)
+        self.dma_channel        = Channel(self.eq,'DMA',ctx.dma_arbiter,ctx.dma_channels,ctx.dma_times,ctx.recorder)
+
+    def channel(self,pe_type,tensor_loc):
+        #channel used to move a tensor between its location and the pe
+        if tensor_loc == 'mem' and 'cpu' in pe_type:
+            return self.mem_channel
+        elif tensor_loc == 'mem' and 'npu' in pe_type:
+            return self.dma_channel
+        elif tensor_loc == 'spm' and 'cpu' in pe_type:
+            return self.dma_channel
+        return None
+
+    def input_transfers(self,pe_type,task):
+        #(channel, tensor) of the inputs of a task moved to the pe
+        transfers = list()
+        for tr in self.g.dependency[task]:
+            channel = self.channel(pe_type,self.tensor_locs[tr])
+            if channel is not None:
+                transfers.append((channel,tr))
+        return transfers
+
+    def arbitration(self,pe_type,channel,task):
+        #requester, priority and allowed channels of a transfer of task by a pe
+        allowed = self.ctx.dma_allowed(pe_type) if channel is self.dma_channel else None
+        return pe_type,self.ctx.task_priority.get(task,0),allowed
+
+    def run(self,par_ste_order):
+        for key in par_ste_order.keys():
+            if self.ctx.recorder.tasks:
+                self.ctx.recorder.record(self.eq.now,'pe_start',key)
+            PE(self,key,par_ste_order[key]).next_task()
+        self.ctx.cpu_cycles = self.eq.run()
+        return self.ctx.cpu_cycles
@@ -12,23 +12,14 @@ Version     : 2.0
 Description : This is the set of global variables that are used in the scheduler.
 '''
 
-from threading import Lock,Semaphore
 from params import *
 
-sem_dma             = Semaphore(1)  #semaphore for DMA channel
-sem_mem             = Semaphore(1)  #semaphore for memory channel
+#The state of a simulation (completion status, start/end times, dma/mem times, cpu cycles
+#and the channel semaphores) is owned by a SimulationContext, see context_class.py.
 
-completion_status   = {}    #task status
 task_dependency     = {}    #task dependencies
 task_extime         = {}    #task execution time
 task_tensors        = {}    #task tensors
 task_weights        = {}    #task tensors
 task_types          = {}    #task types
 tensor_mapping      = {}    #tensor mapping
-
-cpu_cycles          = 0     #cpu cycles
-
-task_start_times    = {}    #start times of execution
-task_end_times      = {}    #end times of execution
-dma_times           = list()#dma start times
-mem_times           = list()#mem start times
@@ -13,8 +13,9 @@ Description : This is the graph class file. Models are converted into this graph
 processed using the scheduler.
 '''
 
-from collections import defaultdict
+from collections import defaultdict, deque
 import copy
+import numpy as np
 
 class node:
     idx         = -1
@@ -72,10 +73,54 @@ class Graph:
         # default dictionary to store type
         self.ltype  = defaultdict(list)
 
+        # reachability index, built on demand
+        self.reach  = None
+
     # function to add an edge to graph
     def addEdge(self, u, v):
         self.graph[u].append(v)
         self.dependency[v].append(u)
+        self.reach = None
+
+    '''A function to drop the reachability index. It is called by addEdge, and must be
+    called after editing graph/dependency directly.'''
+    def invalidateReachability(self):
+        self.reach = None
+
+    '''A function to build the reachability index, the position of each node in a topological
+    order. A node can only reach nodes that come after it, so a search for v stops at the nodes
+    past v. Nothing per pair of nodes is stored.'''
+    def buildReachability(self):
+        order   = self.getTopologicalOrder()
+        self.reach = {'pos':{u:i for i,u in enumerate(order)}}
+        return self.reach
+
+    '''A function to search for v from the nodes in sources, without going past v in the
+    topological order'''
+    def searchPath(self, sources, v):
+        reach   = self.buildReachability() if self.reach is None else self.reach
+        pos     = reach['pos']
+        limit   = pos[v]
+        stack   = [w for w in sources if pos[w] <= limit]
+        visited = set(stack)
+        while len(stack) > 0:
+            w = stack.pop()
+            if w == v:
+                return True
+            for x in self.graph[w]:
+                if x not in visited and pos[x] <= limit:
+                    visited.add(x)
+                    stack.append(x)
+        return False
+
+    '''A function to check if v is reachable from u'''
+    def isReachable(self, u, v):
+        return u != v and self.searchPath(self.graph[u], v)
+
+    '''A function to check if there is a path from u to v other than the edge u->v,
+    i.e. a path with more than two nodes'''
+    def hasAltPath(self, u, v):
+        return self.searchPath([w for w in self.graph[u] if w != v], v)
 
     def addExtime(self, u, e):
         self.extime[u] = e
@@ -95,41 +140,47 @@ class Graph:
             nodes += self.graph[key]
         return max(nodes)
 
+    '''A function to get the nodes in topological order (Kahn's algorithm)'''
+    def getTopologicalOrder(self):
+        n_deps  = {u:len(self.dependency[u]) for u in list(self.dependency.keys())}
+        for u in list(self.graph.keys()):
+            if u not in n_deps:
+                n_deps[u] = 0
+        ready   = deque([u for u in n_deps.keys() if n_deps[u] == 0])
+        order   = list()
+        while len(ready) > 0:
+            u = ready.popleft()
+            order.append(u)
+            for v in self.graph[u]:
+                n_deps[v] -= 1
+                if n_deps[v] == 0:
+                    ready.append(v)
+        return order
+
     '''A function to make a hyperh=graph by replicating the graph n times'''
     def duplicateAndAdd(self):
-        startNodeID = self.getMaxNodeId() + 1
-        #add the edges
-        self.dependency[startNodeID] = []
-        d = copy.deepcopy(self.graph)
-        for key,value in d.items():
-            s = key + startNodeID
-            for v in value:
-                d = v + startNodeID
-                self.addEdge(s,d)
-        #add extime
-        e = copy.deepcopy(self.extime)
-        for key,value in e.items():
-            u = key + startNodeID
-            self.addExtime(u,value)
-
-        #add tensor
-        t = copy.deepcopy(self.tensor)
-        for key,value in t.items():
-            u = key + startNodeID
-            self.addTensor(u,value)
-
-        #add weight
-        w = copy.deepcopy(self.weight)
-        for key,value in w.items():
-            u = key + startNodeID
-            self.addWeight(u,value)
-
-        #add layer type
-        l = copy.deepcopy(self.ltype)
-        for key,value in l.items():
-            u = key + startNodeID
-            self.addLtype(u,value)
-
+        return self.addGraph(self)
+
+    '''A function to add the nodes of another graph, with the node ids shifted by the
+    highest node id of this graph plus one. Each attribute is read in one pass, so other can
+    be this graph itself. It returns the shift.'''
+    def addGraph(self, other):
+        nodes       = list(self.dependency.keys()) + list(self.graph.keys())
+        startNodeID = max(nodes) + 1 if len(nodes) > 0 else 0
+        for u in list(other.dependency.keys()):
+            self.dependency[u + startNodeID] = list()
+        for u in list(other.graph.keys()):
+            for v in other.graph[u]:
+                self.addEdge(u + startNodeID, v + startNodeID)
+        for u,value in list(other.extime.items()):
+            self.addExtime(u + startNodeID, dict(value))
+        for u,value in list(other.tensor.items()):
+            self.addTensor(u + startNodeID, value)
+        for u,value in list(other.weight.items()):
+            self.addWeight(u + startNodeID, value)
+        for u,value in list(other.ltype.items()):
+            self.addLtype(u + startNodeID, value)
+        self.V += other.V
         return startNodeID
 
     '''A recursive function to print all paths from 'u' to 'd'.
@@ -176,3 +227,183 @@ class Graph:
         # Call the recursive helper function to print all paths
         self.getAllPathUtil(s, d, visited, path)
         return self.paths
+
+
+class CSRView:
+    """
+    Read-only, dictionary-like view of one per-node attribute of a CSRGraph, so that
+    g.graph[u], g.extime[u], g.tensor[u], ... work as they do on a Graph
+    """
+    def __init__(self, csr, get, present):
+        self.csr        = csr       # the graph
+        self.get        = get       # function returning the value of a row
+        self.present    = present   # boolean array, True for the rows that have a value
+
+    def __getitem__(self, u):
+        i = self.csr.row(u)
+        if i < 0 or not self.present[i]:
+            return []
+        return self.get(i)
+
+    def __contains__(self, u):
+        i = self.csr.row(u)
+        return i >= 0 and bool(self.present[i])
+
+    def __len__(self):
+        return int(self.present.sum())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return list(self.csr.ids[self.present])
+
+    def values(self):
+        return [self.get(i) for i in np.flatnonzero(self.present)]
+
+    def items(self):
+        return [(self.csr.ids[i], self.get(i)) for i in np.flatnonzero(self.present)]
+
+
+# function to get an array of sizes, int64 if all of them are integers and float64 otherwise,
+# so that no size is truncated
+def get_size_array(sizes):
+    sizes = np.asarray(sizes)
+    if sizes.dtype.kind in 'iub' or (sizes.size == 0 and sizes.dtype.kind == 'f'):
+        return sizes.astype(np.int64)
+    return sizes.astype(np.float64)
+
+# This class represents a directed graph using compressed sparse row (CSR) arrays.
+# It is read-only and exposes the same accessors as Graph (graph, dependency, extime,
+# tensor, weight, ltype) at a fraction of the memory for large graphs.
+class CSRGraph:
+
+    def __init__(self, ids, fwd_offsets, fwd_targets, rev_offsets, rev_sources,
+                 extime, resources, tensor, weight, ltype_codes, ltype_names):
+        # node ids, one row per node
+        self.ids            = np.asarray(ids, dtype=np.int64)
+        self.V              = len(self.ids)
+
+        # row of each node id, -1 for ids that are not in the graph
+        self.index          = np.full(int(self.ids.max()) + 1 if self.V > 0 else 0, -1, dtype=np.int64)
+        self.index[self.ids]= np.arange(self.V)
+
+        # successors of row i are fwd_targets[fwd_offsets[i]:fwd_offsets[i+1]]
+        self.fwd_offsets    = np.asarray(fwd_offsets, dtype=np.int64)
+        self.fwd_targets    = np.asarray(fwd_targets, dtype=np.int64)
+
+        # predecessors of row i are rev_sources[rev_offsets[i]:rev_offsets[i+1]]
+        self.rev_offsets    = np.asarray(rev_offsets, dtype=np.int64)
+        self.rev_sources    = np.asarray(rev_sources, dtype=np.int64)
+
+        # execution time of row i on resources[j] is extime[i,j], nan if not known
+        self.extime_array   = np.asarray(extime, dtype=np.float64).reshape(self.V, len(resources))
+        self.resources      = list(resources)
+
+        # tensor and weight sizes, -1 if not known. Integer sizes are int64, any other sizes
+        # keep their values as float64
+        self.tensor_array   = get_size_array(tensor)
+        self.weight_array   = get_size_array(weight)
+
+        # layer type of row i is ltype_names[ltype_codes[i]], -1 if not known
+        self.ltype_codes    = np.asarray(ltype_codes, dtype=np.int32)
+        self.ltype_names    = list(ltype_names)
+
+        # reachability index, built on demand
+        self.reach          = None
+
+        fwd_degree          = np.diff(self.fwd_offsets)
+        self.graph          = CSRView(self, lambda i: self.fwd_targets[self.fwd_offsets[i]:self.fwd_offsets[i+1]], fwd_degree > 0)
+        self.dependency     = CSRView(self, lambda i: self.rev_sources[self.rev_offsets[i]:self.rev_offsets[i+1]], np.ones(self.V, dtype=bool))
+        self.extime         = CSRView(self, lambda i: {r: e for r, e in zip(self.resources, self.extime_array[i].tolist()) if np.isfinite(e)}, np.isfinite(self.extime_array).any(axis=1))
+        self.tensor         = CSRView(self, lambda i: self.tensor_array[i].item(), self.tensor_array >= 0)
+        self.weight         = CSRView(self, lambda i: self.weight_array[i].item(), self.weight_array >= 0)
+        self.ltype          = CSRView(self, lambda i: self.ltype_names[self.ltype_codes[i]], self.ltype_codes >= 0)
+
+    # function to get the row of a node id
+    def row(self, u):
+        if 0 <= u < len(self.index):
+            return int(self.index[u])
+        return -1
+
+    def getMaxNodeId(self):
+        return self.ids.max()
+
+    '''A function to get the nodes in topological order (Kahn's algorithm)'''
+    def getTopologicalOrder(self):
+        n_deps  = np.diff(self.rev_offsets)
+        ready   = deque(np.flatnonzero(n_deps == 0).tolist())
+        order   = list()
+        while len(ready) > 0:
+            i = ready.popleft()
+            order.append(self.ids[i])
+            for v in self.fwd_targets[self.fwd_offsets[i]:self.fwd_offsets[i+1]]:
+                j = self.index[v]
+                n_deps[j] -= 1
+                if n_deps[j] == 0:
+                    ready.append(j)
+        return order
+
+    buildReachability   = Graph.buildReachability
+    searchPath          = Graph.searchPath
+    isReachable         = Graph.isReachable
+    hasAltPath          = Graph.hasAltPath
+
+    '''A function to convert a Graph into a CSRGraph'''
+    @classmethod
+    def fromGraph(cls, g):
+        nodes = set(g.dependency.keys()) | set(g.graph.keys()) | set(g.extime.keys()) | set(g.tensor.keys()) | set(g.weight.keys()) | set(g.ltype.keys())
+        for value in list(g.graph.values()):
+            nodes |= set(value)
+        ids     = np.array(sorted(nodes), dtype=np.int64)
+        resources = list()
+        for e in g.extime.values():
+            for r in e.keys():
+                if r not in resources:
+                    resources.append(r)
+        ltype_names = list()
+        for l in g.ltype.values():
+            if l not in ltype_names:
+                ltype_names.append(l)
+        fwd_offsets = [0]
+        fwd_targets = list()
+        rev_offsets = [0]
+        rev_sources = list()
+        extime      = np.full((len(ids), len(resources)), np.nan)
+        tensor      = np.full(len(ids), -1, dtype=get_size_array(list(g.tensor.values())).dtype)
+        weight      = np.full(len(ids), -1, dtype=get_size_array(list(g.weight.values())).dtype)
+        ltype_codes = np.full(len(ids), -1, dtype=np.int32)
+        for i, u in enumerate(ids):
+            fwd_targets += g.graph[u] if u in g.graph else []
+            fwd_offsets.append(len(fwd_targets))
+            rev_sources += g.dependency[u] if u in g.dependency else []
+            rev_offsets.append(len(rev_sources))
+            if u in g.extime:
+                for r, e in g.extime[u].items():
+                    extime[i, resources.index(r)] = e
+            if u in g.tensor:
+                tensor[i] = g.tensor[u]
+            if u in g.weight:
+                weight[i] = g.weight[u]
+            if u in g.ltype:
+                ltype_codes[i] = ltype_names.index(g.ltype[u])
+        return cls(ids, fwd_offsets, fwd_targets, rev_offsets, rev_sources,
+                   extime, resources, tensor, weight, ltype_codes, ltype_names)
+
+    '''A function to convert this CSRGraph into a Graph'''
+    def toGraph(self):
+        g = Graph(self.V)
+        for i, u in enumerate(self.ids):
+            g.dependency[u] = list(self.rev_sources[self.rev_offsets[i]:self.rev_offsets[i+1]])
+            successors = list(self.fwd_targets[self.fwd_offsets[i]:self.fwd_offsets[i+1]])
+            if len(successors) > 0:
+                g.graph[u] = successors
+        for key in self.extime.keys():
+            g.addExtime(key, self.extime[key])
+        for key in self.tensor.keys():
+            g.addTensor(key, self.tensor[key])
+        for key in self.weight.keys():
+            g.addWeight(key, self.weight[key])
+        for key in self.ltype.keys():
+            g.addLtype(key, self.ltype[key])
+        return g
@@ -18,24 +18,90 @@ import logging
 import pickle
 import os
 import subprocess
+import hashlib
 
 import globals
 from params import *
 from schedule_class import *
 from graph_class import *
+from profiler import *
 
-def read_graph_data(model_name):
-    graph_name  = 'models/'+model_name+'/graph.txt'
-    extime_name = 'models/'+model_name+'/extime.pkl'
-    tensor_name = 'models/'+model_name+'/tensors.pkl'
-    weight_name = 'models/'+model_name+'/weights.pkl'
-    type_name   = 'models/'+model_name+'/layer_types.pkl'
-    map_name    = 'models/'+model_name+'/mapping.pkl'
-    tmap_name   = 'models/'+model_name+'/tensor_mapping.pkl'
+#version of the binary model bundle, bump it when the bundle layout changes
+MODEL_BUNDLE_VERSION = 2
+
+def get_model_sources(model_name,model_root='models'):
+    model_dir = os.path.join(model_root,model_name)
+    return [os.path.join(model_dir,f) for f in ['graph.txt','extime.pkl','tensors.pkl','weights.pkl','layer_types.pkl']]
+
+def get_model_hash(model_name,model_root='models'):
+    #content hash of the source files of a model
+    h = hashlib.sha256(str(MODEL_BUNDLE_VERSION).encode())
+    for fname in get_model_sources(model_name,model_root):
+        h.update(os.path.basename(fname).encode())
+        if os.path.exists(fname):
+            with open(fname,'rb') as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+def save_model_bundle(g,bundle_name,source_hash):
+    #write a CSRGraph as a single uncompressed .npz bundle
+    np.savez(bundle_name,
+             version        = np.array(MODEL_BUNDLE_VERSION),
+             source_hash    = np.array(source_hash),
+             ids            = g.ids,
+             fwd_offsets    = g.fwd_offsets,
+             fwd_targets    = g.fwd_targets,
+             rev_offsets    = g.rev_offsets,
+             rev_sources    = g.rev_sources,
+             extime         = g.extime_array,
+             resources      = np.array(g.resources,dtype=str),
+             tensor         = g.tensor_array,
+             weight         = g.weight_array,
+             ltype_codes    = g.ltype_codes,
+             ltype_names    = np.array(g.ltype_names,dtype=str))
+
+def load_model_bundle(bundle_name,source_hash):
+    #returns the CSRGraph of a bundle, None if it is missing or stale
+    if not os.path.exists(bundle_name):
+        return None
+    with np.load(bundle_name,allow_pickle=False) as b:
+        if int(b['version']) != MODEL_BUNDLE_VERSION or str(b['source_hash']) != source_hash:
+            return None
+        return CSRGraph(b['ids'],b['fwd_offsets'],b['fwd_targets'],b['rev_offsets'],b['rev_sources'],
+                        b['extime'],b['resources'].tolist(),b['tensor'],b['weight'],b['ltype_codes'],b['ltype_names'].tolist())
+
+def compile_model(model_name,model_root='models'):
+    #one-time conversion of the text/pickle sources of a model into a binary bundle
+    bundle_name = os.path.join(model_root,model_name,'model.npz')
+    source_hash = get_model_hash(model_name,model_root)
+    Gsdcnn      = read_graph_text(model_name,model_root)
+    csr         = CSRGraph.fromGraph(Gsdcnn)
+    try:
+        save_model_bundle(csr,bundle_name,source_hash)
+        logging.info('[info] Compiled %s model into %s',model_name,bundle_name)
+    except OSError as e:
+        logging.info('[info] Could not write %s: %s',bundle_name,e)
+    return Gsdcnn,csr
+
+def read_graph_data(model_name,csr=False,model_root='models'):
+    #read the model from its binary bundle, and fall back to the text/pickle sources
+    #(compiling a new bundle) when the bundle is missing or the sources have changed
+    bundle_name = os.path.join(model_root,model_name,'model.npz')
+    with profile_span('read_graph_data',model=model_name):
+        g           = load_model_bundle(bundle_name,get_model_hash(model_name,model_root))
+        if g is None:
+            with profile_span('compile_model',model=model_name):
+                Gsdcnn,g = compile_model(model_name,model_root)
+            return g if csr else Gsdcnn
+        logging.info('[info] Read %s model from %s',model_name,bundle_name)
+        return g if csr else g.toGraph()
+
+def read_graph_text(model_name,model_root='models'):
+    graph_name,extime_name,tensor_name,weight_name,type_name = get_model_sources(model_name,model_root)
 
     #create task_dependency
     logging.info('[info] Reading Model Graph Information')
-    modelGraph  = np.loadtxt(graph_name,dtype ='int')
+    modelGraph  = np.loadtxt(graph_name,dtype ='int',ndmin=2)    #a graph of one edge is still one row per edge
     nodes       = np.unique(modelGraph.flatten())
     n_nodes     = len(nodes)
     #Define a graph structure
@@ -87,6 +153,73 @@ def read_graph_data(model_name):
 
     return Gsdcnn
 
+def normalize_value(v):
+    #plain python value of a graph attribute, so that its repr does not depend on numpy types
+    if isinstance(v,dict):
+        return sorted([(str(k),normalize_value(x)) for k,x in v.items()])
+    if isinstance(v,(list,tuple,np.ndarray)):
+        return [normalize_value(x) for x in v]
+    if isinstance(v,(str,np.str_)):
+        return str(v)
+    return float(v)
+
+def get_graph_hash(g):
+    #sha256 of the edges and task attributes of a graph. Empty entries are skipped, since
+    #reading a missing key of a defaultdict adds one
+    h = hashlib.sha256()
+    for name,d in [('graph',g.graph),('extime',g.extime),('tensor',g.tensor),('weight',g.weight),('ltype',g.ltype)]:
+        h.update(name.encode())
+        h.update(repr(sorted([(int(k),normalize_value(v)) for k,v in d.items() if not (isinstance(v,list) and len(v) == 0)])).encode())
+    return h.hexdigest()
+
+def get_critical_path_lengths(g):
+    #length of the longest path from each task to a sink, using the fastest extime of each task
+    cp_length = {}
+    for t in reversed(g.getTopologicalOrder()):
+        tail = [cp_length[s] for s in g.graph[t] if s in cp_length]
+        cp_length[t] = min(g.extime[t].values()) + (max(tail) if len(tail) > 0 else 0)
+    return cp_length
+
+def get_transferred_inputs(g,pe_type,task,tensor_locs):
+    #inputs of a task that are moved to the pe by a mem or dma transfer
+    return [tr for tr in g.dependency[task] if not (tensor_locs[tr] == 'spm' and 'npu' in pe_type)]
+
+def get_weight_size(g,task):
+    #size of the weights of a task, 0 for tasks without weights
+    return g.weight[task] if task in g.weight else 0
+
+def get_transferred_weights(cfg,g,pe_type,task,weight_locs):
+    #size of the weights of a task moved to the pe, if weights are modeled
+    if not cfg['model_weights'] or weight_locs is None:
+        return 0
+    if weight_locs.get(task,'mem') == 'spm' and 'npu' in pe_type:
+        return 0
+    return get_weight_size(g,task)
+
+def get_pinned_spm(cfg,g,task_map):
+    #kb of the scratchpad of each tile taken by the tensors and weights pinned to it by ActMap
+    pinned = {}
+    for m in task_map:
+        if m['resource'] != 'npu':
+            continue
+        size = g.tensor[m['task']] if m['tensor'] == 'spm' else 0
+        if cfg['model_weights'] and m.get('weight','mem') == 'spm':
+            size += get_weight_size(g,m['task'])
+        pinned[m['tile']] = pinned.get(m['tile'],0) + size * cfg['bit_precision'] / (8 * 1024.0)
+    return pinned
+
+def fits_spm(cfg,g,pe_type,task,next_task,tensor_locs,weight_locs=None,pinned=None):
+    #the inputs and output of task and the inputs of next_task fit in the scratchpad of a tile,
+    #next to what is pinned to it (kb of each tile, see get_pinned_spm)
+    tensors = get_transferred_inputs(g,pe_type,task,tensor_locs) + get_transferred_inputs(g,pe_type,next_task,tensor_locs)
+    if tensor_locs[task] != 'spm':              #a pinned output is already in the pinned kb
+        tensors.append(task)
+    size    = sum([g.tensor[tr] for tr in tensors])
+    size   += get_transferred_weights(cfg,g,pe_type,task,weight_locs) + get_transferred_weights(cfg,g,pe_type,next_task,weight_locs)
+    size_kb = size * cfg['bit_precision'] / (8 * 1024.0)
+    free_kb = cfg['spm_sz_per_tile'] - (0 if pinned is None else pinned.get(int(pe_type.split('_')[1]),0))
+    return size_kb <= free_kb
+
 def uniquefy(l):
     lset  = set(l)
     ulist = (list(lset))
@@ -18,6 +18,8 @@ from threading import Thread, Lock
 import concurrent.futures
 import time
 import pickle
+import atexit
+import ast
 import numpy as np
 
 #Global Parameters
@@ -37,22 +39,53 @@ from nsoc_resource import *
 
 #Import the design flow
 import SMART
+from cache_class import *
+from cosched import *
+from schedule_trace import *
 
 #Arguments
 import argparse
 parser = argparse.ArgumentParser()
 parser.add_argument('-model','--model',default='example')
 parser.add_argument('-fname','--fname',default='run.log')
+parser.add_argument('-engine','--engine',default='thread',choices=['thread','event'])
+parser.add_argument('-priority','--priority',default='steuni',choices=['steuni','id','critical_path','extime'])
+parser.add_argument('-cache','--cache',default='cache',help='stage cache directory')
+parser.add_argument('-cache_size','--cache_size',type=float,default=1024,help='stage cache size in MB')
+parser.add_argument('-no_cache','--no_cache',action='store_true',help='recompute all stages without reading or writing the cache')
+parser.add_argument('-batch','--batch',type=int,default=1,help='number of inferences scheduled end to end')
+parser.add_argument('-max_copies','--max_copies',type=int,default=None,help='largest batch scheduled to find the steady-state interval, the -batch size if not set')
+parser.add_argument('-clear_cache','--clear_cache',action='store_true',help='remove all entries of the cache before running')
+parser.add_argument('-trace','--trace',default='off',choices=list(TRACE_LEVELS.keys()),help='events of the list schedulers to log: off, tasks or transfers')
+parser.add_argument('-save','--save',default='both',choices=['pickle','columnar','both'],help='save the schedules as a pickle, a columnar trace or both')
+parser.add_argument('-profile','--profile',default=None,help='profile the flow and write it to <profile>.json and <profile>.trace.json')
+parser.add_argument('-params','--params',nargs='*',default=[],help="parameter values as key=value, e.g. solver=\'cbc\' solver_time_limit=60")
 
 #Initialization
 args 		                    = vars(parser.parse_args())
 model_name                      = args['model']
 log_fname                       = args['fname']
+engine                          = args['engine']
+priority                        = args['priority']
+cache_dir                       = args['cache']
+cache_size                      = int(args['cache_size'] * 1024 * 1024)
+n_batch                         = args['batch']
+profile_prefix                  = args['profile']
+save_format                     = args['save']
+overrides                       = {'trace_level':args['trace']}
+for arg in args['params']:
+    key,value                   = arg.split('=',1)
+    overrides[key]              = ast.literal_eval(value)
+cfg                             = get_params(overrides)
 
 if __name__ == "__main__":
     format = "[%(asctime)s]: %(message)s"
     handlers = [logging.FileHandler(log_fname), logging.StreamHandler()]
-    logging.basicConfig(format=format, level=logging.INFO,datefmt="%H:%M:%S",handlers = handlers)
+    listener = start_log_listener(handlers,format,"%H:%M:%S")  #the handlers write from a background thread
+    atexit.register(listener.stop)                              #flush the queued records at exit
+
+    if profile_prefix is not None:
+        enable_profiling()
 
     #start a timer
     start_time = time.time()
@@ -63,47 +96,49 @@ if __name__ == "__main__":
     elapsed = time.time() - start_time
     logging.info('[info] Reading %s graph took %s seconds',model_name,elapsed)
    
-    #STEUni
-    task_order  = SMART.STEUni(Gsdcnn,model_name)
-    start_map   = mapper(Gsdcnn)
-    steuni_schd = list_scheduler(Gsdcnn,task_order,start_map,model_name)
-    
-    #OpMap
-    filtered_task_order = list()    #create a filter for those tasks that are supported on the NPU
-    for task in task_order:
-        if Gsdcnn.ltype[task] in NPU_SUPPORTED_OPERATIONS or len(NPU_SUPPORTED_OPERATIONS) == 0:
-            filtered_task_order.append(task)
-    task_tensors= Gsdcnn.tensor
-    opmap       = SMART.OpMap(filtered_task_order,task_tensors,model_name)
-    task_ids    = [m['task'] for m in start_map]
-    opmap_map   = copy.deepcopy(start_map)
-    for key in opmap.keys():
-        tile     = opmap[key]['tile']
-        resource = opmap[key]['resource']
-        opmap_map[task_ids.index(key)]['resource']= resource 
-        opmap_map[task_ids.index(key)]['tile']    = tile
-    opmap_schd = list_scheduler(Gsdcnn,task_order,opmap_map,model_name)
-
-    #ActMap
-    actmap      = SMART.ActMap(Gsdcnn,opmap_map,model_name)
-    actmap_map  = copy.deepcopy(opmap_map)
-    all_tasks   = [task['task'] for task in actmap_map]
-    for task in actmap:
-        task_id                         = all_tasks.index(task)
-        actmap_map[task_id]['tensor']   = 'spm'
-    actmap_schd = list_scheduler(Gsdcnn,task_order,actmap_map,model_name)
-    
-    #STEPar
-    stepar_schd = copy.deepcopy(actmap_schd)
-
-    #IPCSchd
-    ipc_schd        = SMART.IPCSchd(Gsdcnn,task_order,stepar_schd,model_name)
-
-    #ParSchd
-    par_schd        = SMART.ParSchd(Gsdcnn,ipc_schd,model_name)
+    #stage cache
+    cache = None
+    if args['clear_cache']:
+        StageCache(cache_dir,cache_size).clear()
+    if not args['no_cache']:
+        cache = StageCache(cache_dir,cache_size)
+
+    #batch of inferences, replicated graph scheduled end to end
+    if n_batch > 1:
+        #several batches of up to thousands of tasks are scheduled, with the event engine and
+        #the OpMap heuristic unless -params sets the OpMap solver
+        if engine == 'thread':
+            logging.info('[info] Batches are scheduled with the event engine')
+            engine = 'event'
+        if 'opmap' not in cfg['solver_stages']:
+            cfg['solver_stages'] = dict(cfg['solver_stages'],opmap={'solver':'heuristic'})
+        schedule_dict,report = BatchFlow(model_name,n_batch,cfg,engine,priority,cache,args['max_copies'])
+        if save_format != 'columnar':
+            pickle.dump({'schedules':schedule_dict,'report':report},open('results/'+model_name+'_x'+str(n_batch)+'.pkl','wb'))
+        if save_format != 'pickle':
+            write_trace('results/'+model_name+'_x'+str(n_batch)+'.trace',schedule_dict)
+        log_batch_report(report)
+        if profile_prefix is not None:
+            write_profile(profile_prefix)
+        exit()
+
+    #SMART design flow, the schedule of each stage goes to the trace as soon as it is done
+    trace_writer    = TraceWriter('results/'+model_name+'.trace') if save_format != 'pickle' else None
+    schedule_dict   = SMART.SMARTFlow(Gsdcnn,model_name,cfg,engine,priority,cache,trace_writer=trace_writer)
+    if trace_writer is not None:
+        trace_writer.close()
+        logging.info('[info] Trace written to results/%s.trace',model_name)
+    steuni_schd     = schedule_dict['steuni']
+    opmap_schd      = schedule_dict['opmap']
+    actmap_schd     = schedule_dict['actmap']
+    stepar_schd     = schedule_dict['stepar']
+    ipc_schd        = schedule_dict['ipcschd']
+    par_schd        = schedule_dict['parschd']
 
     #save the results
     ofname          = 'results/'+model_name+'.pkl' 
-    schedule_dict   = {'steuni':steuni_schd, 'opmap':opmap_schd, 'actmap':actmap_schd, 'stepar':stepar_schd, 'ipcschd':ipc_schd, 'parschd':par_schd}
-    pickle.dump(schedule_dict,open(ofname,'wb'))
+    if save_format != 'columnar':
+        pickle.dump(schedule_dict,open(ofname,'wb'))
     logging.info('[info] steuni_schd = %s, opmap_schd = %s, actmap_schd = %s, stepar_schd = %s, ipc_schd = %s, par_schd = %s',steuni_schd.get_completion_time(),opmap_schd.get_completion_time(),actmap_schd.get_completion_time(),stepar_schd.get_completion_time(),ipc_schd.get_completion_time(),par_schd.get_completion_time())
+    if profile_prefix is not None:
+        write_profile(profile_prefix)
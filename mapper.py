@@ -40,7 +40,9 @@ from schedule_class import *
 #Resource Definition
 from nsoc_resource import *
 
-def mapper(g):
+def mapper(g,cfg=None):
+    cfg          = get_params() if cfg is None else cfg #hardware configuration
+    s            = profile_span('mapper')
     layer_ids    = list(g.ltype.keys())   #all layer ids
     layer_types  = list(g.ltype.values()) #all layer types
     task_tensors = list(g.tensor.values())#all tensor values
@@ -52,7 +54,7 @@ def mapper(g):
         tile_id = 0
         resource = 'cpu'
         #process mapping
-        if layer_type not in NPU_SUPPORTED_OPERATIONS:
+        if layer_type not in cfg['NPU_SUPPORTED_OPERATIONS']:
             resource = 'cpu'
         #hw specific name
         layer_name = layer_type
@@ -67,6 +69,7 @@ def mapper(g):
 
         #tensor mapping explorations
         tensor_location = 'mem'
+        weight_location = 'mem'
 
         m = {
             'task':layer_id,
@@ -74,7 +77,8 @@ def mapper(g):
             'name':layer_name,
             'resource':resource,
             'tile':tile_id,
-            'tensor':tensor_location
+            'tensor':tensor_location,
+            'weight':weight_location
         }
         task_map.append(m)
     #tensor mapping here
@@ -87,4 +91,5 @@ def mapper(g):
 
     tensor_locs = [m['tensor'] for m in task_map]
     logging.info('[info] mapped %s operations to SPM out of a total %s',tensor_locs.count('spm'),len(tensor_locs))
+    end_span(s)
     return task_map
@@ -13,133 +13,189 @@ Description : This is a multi-threaded implementation of the nsoc resources.
 '''
 #Headers
 import threading
-from threading import Thread, Lock, Semaphore
+from threading import Thread, Lock
 import logging
 import concurrent.futures
 import time
 import numpy as np
 
-#Global Parameters
-import globals
+#Simulation State
+from context_class import *
 from schedule_class import *
+from helper_fns import *
 
 #Configuration Parameters
 from params import *
 
-def mem(size,task,dst):
-    globals.sem_mem.acquire()                   #lock the memory channel
+def acquire_channel(ctx,arbiter,requester,priority,allowed=None):
+    wait_start = time.perf_counter()
+    with ctx.channel_cond:
+        ticket = arbiter.request(requester,priority,allowed)   #queue the request
+        arbiter.grant()                                         #grant the free channels
+        ctx.channel_cond.notify_all()
+        while ticket not in arbiter.granted:                    #wait until a channel is granted to this request
+            ctx.channel_cond.wait()
+        channel = arbiter.granted.pop(ticket)
+    profile_count('thread.'+arbiter.name.lower()+'_channel_wait',time.perf_counter() - wait_start)   #in seconds
+    profile_count('thread.'+arbiter.name.lower()+'_transfers')
+    return channel
+
+def release_channel(ctx,arbiter,channel):
+    with ctx.channel_cond:
+        arbiter.release(channel)                                #release the channel
+        arbiter.grant()                                         #and grant it to the next request
+        ctx.channel_cond.notify_all()
+
+def mem(ctx,size,task,dst,requester=None,priority=0):
+    channel = acquire_channel(ctx,ctx.mem_arbiter,requester,priority)  #lock a memory channel
+    tx_granularity,clock_period = ctx.mem_channels[channel]
     header = {'src':task,'dst':dst}             #transfer header
     s = MemorySchedule(header)                  #create empty memory schedule
-    current_elapsed_time = globals.cpu_cycles   #current time
+    s.set_channel(channel)                      #channel of the transfer
+    current_elapsed_time = ctx.cpu_cycles       #current time
     s.set_start_time(current_elapsed_time)      #set the start time of the schedule
-    logging.info('[info] Task %s Start Mem Transfer at %s',task,current_elapsed_time)
+    if ctx.recorder.transfers:                  #a transfer without a source task loads the weights of dst
+        ctx.recorder.record(current_elapsed_time,'weight_start' if task is None else 'transfer_start','Mem',dst if task is None else task,channel)
 
-    mem_cycles  = size / mem_tx_granularity     #total amount of data to be transferred
-    mem_time    = mem_cycles * mem_clock_period #total number of clock cycles needed for this transfer 
+    mem_cycles  = size / tx_granularity         #total amount of data to be transferred
+    mem_time    = mem_cycles * clock_period     #total number of clock cycles needed for this transfer
     expected_completion_time = current_elapsed_time + mem_time  #expected end time of the memory transfer
     while(current_elapsed_time < expected_completion_time):     #keep checking if the time has elapsed, exit the loop if so
-        time.sleep(usec)                                        #sleep for a us 
-        current_elapsed_time = globals.cpu_cycles               #keep pooling the current time
-    current_elapsed_time = globals.cpu_cycles   #current time of the system
+        time.sleep(ctx.cfg['usec'])                             #sleep for a us 
+        current_elapsed_time = ctx.cpu_cycles                   #keep pooling the current time
+    current_elapsed_time = ctx.cpu_cycles       #current time of the system
     s.set_end_time(current_elapsed_time)        #set the end time of the schedule
-    logging.info('[info] Task %s End Mem Transfer at %s',task,current_elapsed_time)
-    globals.mem_times.append(s)                 #append the schedule to the global list of memory transactions
-    globals.sem_mem.release()                   #release the memory channel
+    if ctx.recorder.transfers:
+        ctx.recorder.record(current_elapsed_time,'weight_end' if task is None else 'transfer_end','Mem',dst if task is None else task)
+    ctx.mem_times.append(s)                     #append the schedule to the list of memory transactions
+    release_channel(ctx,ctx.mem_arbiter,channel)    #release the memory channel
 
-def dma(size,task,dst):
-    globals.sem_dma.acquire()                   #lock the external dma channel
+def dma(ctx,size,task,dst,requester=None,priority=0):
+    allowed = None if requester is None else ctx.dma_allowed(requester)   #dma channels of the pe
+    channel = acquire_channel(ctx,ctx.dma_arbiter,requester,priority,allowed)  #lock a dma channel
+    tx_granularity,clock_period = ctx.dma_channels[channel]
     header = {'src':task,'dst':dst}             #transfer header
     s = MemorySchedule(header)                  #create empty dma schedule
-    current_elapsed_time = globals.cpu_cycles   #current time
+    s.set_channel(channel)                      #channel of the transfer
+    current_elapsed_time = ctx.cpu_cycles       #current time
     s.set_start_time(current_elapsed_time)      #set the start time of the schedule
-    logging.info('[info] Task %s Start DMA Transfer at %s',task,current_elapsed_time)
+    if ctx.recorder.transfers:                  #a transfer without a source task loads the weights of dst
+        ctx.recorder.record(current_elapsed_time,'weight_start' if task is None else 'transfer_start','DMA',dst if task is None else task,channel)
 
-    dma_cycles  = size / dma_tx_granularity     #total amount of data to be transferred
-    dma_time    = dma_cycles * dma_clock_period #total number of clock cycles needed for this transfer
+    dma_cycles  = size / tx_granularity         #total amount of data to be transferred
+    dma_time    = dma_cycles * clock_period     #total number of clock cycles needed for this transfer
     expected_completion_time = current_elapsed_time + dma_time  #expected end time of the dma transfer
     while(current_elapsed_time < expected_completion_time):     #keep checking if the time has elapsed, exit the loop if so
-        time.sleep(usec)                                        #sleep for a us 
-        current_elapsed_time = globals.cpu_cycles               #keep pooling the current time
-    current_elapsed_time = globals.cpu_cycles   #current time of the system
+        time.sleep(ctx.cfg['usec'])                             #sleep for a us 
+        current_elapsed_time = ctx.cpu_cycles                   #keep pooling the current time
+    current_elapsed_time = ctx.cpu_cycles       #current time of the system
     s.set_end_time(current_elapsed_time)        #set the end time of the schedule
-    logging.info('[info] Task %s End DMA Transfer at %s',task,current_elapsed_time)
-    globals.dma_times.append(s)                 #append the schedule to the global list of memory transaction
-    globals.sem_dma.release()                   #release the dma channel
+    if ctx.recorder.transfers:
+        ctx.recorder.record(current_elapsed_time,'weight_end' if task is None else 'transfer_end','DMA',dst if task is None else task)
+    ctx.dma_times.append(s)                     #append the schedule to the list of memory transaction
+    release_channel(ctx,ctx.dma_arbiter,channel)    #release the dma channel
+
+def get_inputs(ctx,g,pe_type,t,tensor_locs,weight_locs=None):
+    dependent_tasks_t           = g.dependency[t]                                               #list of tasks on which t depends on
+    dependent_tasks_t_tensor_loc= [tensor_locs[task_t] for task_t in dependent_tasks_t]         #dependent task's tensors location
+    dependent_tasks_t_tensor_sz = [g.tensor[task_t] for task_t in dependent_tasks_t]            #dependent task's tensors size
 
-def pe(g,pe_type,task_list,tensor_locs):        #this is a processing element
-    current_elapsed_time = globals.cpu_cycles
-    logging.info('[info] Starting PE %s at time %s',pe_type,current_elapsed_time)
-    for t in task_list: #for each task mapped to this PE
+    ready                       = False                                                         #assume the task is not ready
+    wait_start                  = time.perf_counter()
+    while not ready:        #while the task is not ready
+        time.sleep(ctx.cfg['usec']) #sleep for a us and check again
+        dependent_tasts_t_status    = [ctx.completion_status[ti] for ti in dependent_tasks_t]       #status of these tasks
+        if 0 not in dependent_tasts_t_status or len(dependent_tasts_t_status) == 0: #if all dependent tasks are done or no dependent tasks
+            ready = True    #make the task ready
+    profile_count('thread.dependency_wait',time.perf_counter() - wait_start)                   #in seconds
+    ####################################
+    #get input
+    ####################################
+    tr_threads = list()
+    for tr,tr_loc,tr_sz in zip(dependent_tasks_t,dependent_tasks_t_tensor_loc,dependent_tasks_t_tensor_sz):
+        if tr_loc == 'mem' and 'cpu' in pe_type:
+            thread = threading.Thread(target=mem, args=(ctx,tr_sz,tr,t,pe_type,ctx.task_priority.get(t,0),))
+            thread.start()
+            tr_threads.append(thread)
+        elif tr_loc == 'mem' and 'npu' in pe_type:
+            thread = threading.Thread(target=dma, args=(ctx,tr_sz,tr,t,pe_type,ctx.task_priority.get(t,0),))
+            tr_threads.append(thread)
+            thread.start()
+        elif tr_loc == 'spm' and 'cpu' in pe_type:
+            thread = threading.Thread(target=dma, args=(ctx,tr_sz,tr,t,pe_type,ctx.task_priority.get(t,0),))
+            tr_threads.append(thread)
+            thread.start()
+    #get weights
+    weights = get_transferred_weights(ctx.cfg,g,pe_type,t,weight_locs)  #size of the weights to load
+    if weights > 0:
+        weight_loc = weight_locs.get(t,'mem')
+        if weight_loc == 'mem' and 'cpu' in pe_type:
+            thread = threading.Thread(target=mem, args=(ctx,weights,None,t,pe_type,ctx.task_priority.get(t,0),))
+        else:
+            thread = threading.Thread(target=dma, args=(ctx,weights,None,t,pe_type,ctx.task_priority.get(t,0),))
+        tr_threads.append(thread)
+        thread.start()
+    for thread in tr_threads:
+        thread.join()
+
+def pe(ctx,g,pe_type,task_list,tensor_locs,weight_locs=None):  #this is a processing element
+    current_elapsed_time = ctx.cpu_cycles
+    if ctx.recorder.tasks:
+        ctx.recorder.record(current_elapsed_time,'pe_start',pe_type)
+    prefetch        = ctx.cfg['pe_prefetch'] and 'npu' in pe_type   #fetch the inputs of the next task during execution
+    prefetch_thread = None                                          #thread fetching the inputs of the current task
+    for i,t in enumerate(task_list): #for each task mapped to this PE
         #check if all its dependent tasks are ready
         #if ready, fire the task and wait for its completion
         #otherwise wait
         task_resource               = pe_type.split('_')[0]                                         #task's resource = cpu or npu
         task_extime                 = g.extime[t][task_resource]                                    #task's extime
-        dependent_tasks_t           = g.dependency[t]                                               #list of tasks on which t depends on
-        dependent_tasks_t_tensor_loc= [tensor_locs[task_t] for task_t in dependent_tasks_t]         #dependent task's tensors location
-        dependent_tasks_t_tensor_sz = [g.tensor[task_t] for task_t in dependent_tasks_t]            #dependent task's tensors size
-
-        ready                       = False                                                         #assume the task is not ready
-        while not ready:        #while the task is not ready
-            time.sleep(usec)    #sleep for a us and check again
-            dependent_tasts_t_status    = [globals.completion_status[ti] for ti in dependent_tasks_t]   #status of these tasks
-            if 0 not in dependent_tasts_t_status or len(dependent_tasts_t_status) == 0: #if all dependent tasks are done or no dependent tasks
-                ready = True    #make the task ready
-        #if the task is not ready, then lets wait
-        #else fire the task on this pe
-        if ready:
-            ####################################
-            #get input
-            ####################################
-            tr_threads = list()
-            for tr,tr_loc,tr_sz in zip(dependent_tasks_t,dependent_tasks_t_tensor_loc,dependent_tasks_t_tensor_sz):
-                if tr_loc == 'mem' and 'cpu' in pe_type:
-                    thread = threading.Thread(target=mem, args=(tr_sz,tr,t,))
-                    thread.start()
-                    tr_threads.append(thread)
-                elif tr_loc == 'mem' and 'npu' in pe_type:
-                    thread = threading.Thread(target=dma, args=(tr_sz,tr,t,))
-                    tr_threads.append(thread)
-                    thread.start()
-                elif tr_loc == 'spm' and 'cpu' in pe_type:
-                    thread = threading.Thread(target=dma, args=(tr_sz,tr,t,))
-                    tr_threads.append(thread)
-                    thread.start()
-            for thread in tr_threads:
-                thread.join()
-            ####################################
-            #execute
-            ####################################
-            current_elapsed_time = globals.cpu_cycles
-            logging.info('[info] PE = %s, Starting task %s (extime = %s) at time %s',pe_type,t,task_extime,current_elapsed_time)
-            globals.task_start_times[t] = current_elapsed_time                  #fill the task start times
-            expected_completion_time    = current_elapsed_time + task_extime    #find the expected end time
-            while(current_elapsed_time < expected_completion_time):             #wait for the task completion
-                time.sleep(usec)                                                #check every us to see if the task has completedc 
-                current_elapsed_time = globals.cpu_cycles                       #update the current elapsed time
-            globals.task_end_times[t]   = current_elapsed_time                  #fill the task end times
-            logging.info('[info] PE = %s, Ending task %s at time %s',pe_type,t,current_elapsed_time)
-            ####################################
-            #save output
-            ####################################
-            rx_threads = list()
-            if tensor_locs[t] == 'mem' and 'cpu' in pe_type:
-                thread = threading.Thread(target=mem, args=(g.tensor[t],t,None,))
-                thread.start()
-                rx_threads.append(thread)
-            elif tensor_locs[t] == 'mem' and 'npu' in pe_type:
-                thread = threading.Thread(target=dma, args=(g.tensor[t],t,None,))
-                thread.start()
-                rx_threads.append(thread)
-            elif tensor_locs[t] == 'spm' and 'cpu' in pe_type:
-                thread = threading.Thread(target=dma, args=(g.tensor[t],t,None,))
-                thread.start()
-                rx_threads.append(thread)
-            #join all threads
-            for thread in rx_threads:
-                thread.join()
-            ####################################
-            #update the completion status
-            ####################################
-            globals.completion_status[t] = 1                                #update the status of the task as completed 
-
+        if prefetch_thread is None:
+            get_inputs(ctx,g,pe_type,t,tensor_locs,weight_locs) #wait for the dependent tasks and get the inputs
+        else:
+            if not prefetch_thread.is_alive():          #inputs arrived before the task was dispatched
+                ctx.prefetched_tasks.append(t)
+            prefetch_thread.join()                      #inputs were prefetched
+            prefetch_thread = None
+        ####################################
+        #execute
+        ####################################
+        current_elapsed_time = ctx.cpu_cycles
+        if ctx.recorder.tasks:
+            ctx.recorder.record(current_elapsed_time,'task_start',pe_type,t,task_extime)
+        ctx.task_start_times[t] = current_elapsed_time                      #fill the task start times
+        if prefetch and i + 1 < len(task_list) and fits_spm(ctx.cfg,g,pe_type,t,task_list[i + 1],tensor_locs,weight_locs,ctx.spm_pinned):
+            if ctx.recorder.tasks:
+                ctx.recorder.record(current_elapsed_time,'prefetch',pe_type,task_list[i + 1])
+            prefetch_thread = threading.Thread(target=get_inputs, args=(ctx,g,pe_type,task_list[i + 1],tensor_locs,weight_locs,))
+            prefetch_thread.start()
+        expected_completion_time    = current_elapsed_time + task_extime    #find the expected end time
+        while(current_elapsed_time < expected_completion_time):             #wait for the task completion
+            time.sleep(ctx.cfg['usec'])                                     #check every us to see if the task has completedc 
+            current_elapsed_time = ctx.cpu_cycles                           #update the current elapsed time
+        ctx.task_end_times[t]   = current_elapsed_time                      #fill the task end times
+        if ctx.recorder.tasks:
+            ctx.recorder.record(current_elapsed_time,'task_end',pe_type,t)
+        ####################################
+        #save output
+        ####################################
+        rx_threads = list()
+        if tensor_locs[t] == 'mem' and 'cpu' in pe_type:
+            thread = threading.Thread(target=mem, args=(ctx,g.tensor[t],t,None,pe_type,ctx.task_priority.get(t,0),))
+            thread.start()
+            rx_threads.append(thread)
+        elif tensor_locs[t] == 'mem' and 'npu' in pe_type:
+            thread = threading.Thread(target=dma, args=(ctx,g.tensor[t],t,None,pe_type,ctx.task_priority.get(t,0),))
+            thread.start()
+            rx_threads.append(thread)
+        elif tensor_locs[t] == 'spm' and 'cpu' in pe_type:
+            thread = threading.Thread(target=dma, args=(ctx,g.tensor[t],t,None,pe_type,ctx.task_priority.get(t,0),))
+            thread.start()
+            rx_threads.append(thread)
+        #join all threads
+        for thread in rx_threads:
+            thread.join()
+        ####################################
+        #update the completion status
+        ####################################
+        ctx.completion_status[t] = 1                                    #update the status of the task as completed
@@ -33,3 +33,74 @@ dma_tx_granularity=64*8     #in bits
 dma_clock_period=10.0       #in micro-seconds
 mem_tx_granularity=128*8    #in bits
 mem_clock_period=10.0       #in micro-seconds
+
+#channels
+n_dma_channels=1                #number of dma channels
+n_mem_channels=1                #number of memory channels
+channel_arbitration='fifo'      #fifo, round_robin (between pes) or priority (critical path of the task served)
+dma_channel_binding='shared'    #shared: any dma channel, tile: npu pes of tile k use dma channel k % n_dma_channels
+dma_channel_tx_granularity=None #per-channel granularity in bits, None for dma_tx_granularity on every channel
+dma_channel_clock_periods=None  #per-channel clock period, None for dma_clock_period on every channel
+mem_channel_tx_granularity=None #per-channel granularity in bits, None for mem_tx_granularity on every channel
+mem_channel_clock_periods=None  #per-channel clock period, None for mem_clock_period on every channel
+
+#pes
+pe_prefetch=False           #npu pes fetch the inputs of the next task while the current one executes, if both fit in the spm
+model_weights=False         #fetch the weights of each task before it executes, and let ActMap pin weights to the spm
+
+#solvers
+solver='auto'               #gurobi, highs, cbc, heuristic, or auto = first available of gurobi, highs, cbc (OpMap uses its heuristic unless gurobi is available)
+solver_time_limit=None      #time limit of a solve in seconds, None for no limit
+solver_mip_gap=None         #relative MIP gap target, None for the solver default
+solver_threads=None         #number of solver threads, None for the solver default
+solver_msg=1                #solver verbosity
+solver_stages={}            #per-stage settings, e.g. {'opmap':{'solver':'heuristic'},'actmap':{'time_limit':10}}
+
+#OpMap
+opmap_heuristic='lpt'       #heuristic of OpMap: lpt (largest first) or kk (Karmarkar-Karp), both followed by local search
+opmap_warm_start=False      #run the heuristic first and use it as a warm start of the ILP
+
+#trace
+trace_level='off'           #events of the list schedulers logged after each simulation: off, tasks or transfers
+trace_buffer=1000000        #events kept per simulation, older events are dropped, None for no limit
+
+def get_params(overrides=None):
+    '''Returns the configuration as a dictionary. Entries in overrides replace the
+    defaults above, so that a configuration can be passed explicitly to the flow.'''
+    cfg = {
+        'n_tiles'                   : n_tiles,
+        'spm_sz_per_tile'           : spm_sz_per_tile,
+        'bit_precision'             : bit_precision,
+        'usec'                      : usec,
+        'NPU_SUPPORTED_OPERATIONS'  : NPU_SUPPORTED_OPERATIONS,
+        'dma_tx_granularity'        : dma_tx_granularity,
+        'dma_clock_period'          : dma_clock_period,
+        'mem_tx_granularity'        : mem_tx_granularity,
+        'mem_clock_period'          : mem_clock_period,
+        'n_dma_channels'            : n_dma_channels,
+        'n_mem_channels'            : n_mem_channels,
+        'channel_arbitration'       : channel_arbitration,
+        'dma_channel_binding'       : dma_channel_binding,
+        'dma_channel_tx_granularity': dma_channel_tx_granularity,
+        'dma_channel_clock_periods' : dma_channel_clock_periods,
+        'mem_channel_tx_granularity': mem_channel_tx_granularity,
+        'mem_channel_clock_periods' : mem_channel_clock_periods,
+        'pe_prefetch'               : pe_prefetch,
+        'model_weights'             : model_weights,
+        'solver'                    : solver,
+        'solver_time_limit'         : solver_time_limit,
+        'solver_mip_gap'            : solver_mip_gap,
+        'solver_threads'            : solver_threads,
+        'solver_msg'                : solver_msg,
+        'solver_stages'             : solver_stages,
+        'opmap_heuristic'           : opmap_heuristic,
+        'opmap_warm_start'          : opmap_warm_start,
+        'trace_level'               : trace_level,
+        'trace_buffer'              : trace_buffer,
+    }
+    if overrides is not None:
+        for key in overrides.keys():
+            if key not in cfg:
+                raise KeyError('unknown parameter '+str(key))
+        cfg.update(overrides)
+    return cfg
@@ -0,0 +1,175 @@
+'''
+Copyright © 2023 Prof. Anup Das
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+Author      : Anup Das
+Date        : July 02, 2023
+Version     : 2.0
+Description : This is the profiler of the SMART flow. Stages open nested spans (timers), and
+add to counters and gauges. The profile is exported as json or in the Chrome trace format
+(chrome://tracing, Perfetto). The profiler is disabled by default, and then each call returns
+right away.
+'''
+
+import json
+import logging
+import os
+import threading
+import time
+
+class Span:
+    """
+    Class to hold one timed section of the flow
+    """
+    __slots__ = ['name','args','start','end','tid','depth','parent']
+
+    def __init__(self,name,args,start,tid,depth,parent):
+        self.name   = name          #name of the section
+        self.args   = args          #extra information, e.g. the model or stage
+        self.start  = start         #in seconds since the profile started
+        self.end    = None
+        self.tid    = tid           #thread that ran the section
+        self.depth  = depth         #nesting level in its thread
+        self.parent = parent        #name of the enclosing span, None at the top level
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        end_span(self)
+        return False
+
+class NullSpan:
+    """
+    Span returned while the profiler is disabled, it does nothing
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        return False
+
+class Profiler:
+    """
+    Class to collect the spans, counters and gauges of a run
+    """
+    def __init__(self):
+        self.enabled    = False
+        self.lock       = threading.Lock()
+        self.local      = threading.local() #stack of the open spans of each thread
+        self.reset()
+
+    def reset(self):
+        self.origin     = time.perf_counter()
+        self.spans      = list()            #finished spans
+        self.counters   = {}                #name -> total
+        self.gauges     = {}                #name -> list of (time, value)
+
+    def now(self):
+        return time.perf_counter() - self.origin
+
+    def stack(self):
+        if not hasattr(self.local,'stack'):
+            self.local.stack = list()
+        return self.local.stack
+
+profiler    = Profiler()
+NULL_SPAN   = NullSpan()
+
+def enable_profiling(reset=True):
+    if reset:
+        profiler.reset()
+    profiler.enabled = True
+
+def disable_profiling():
+    profiler.enabled = False
+
+def is_profiling():
+    return profiler.enabled
+
+def profile_span(name,**args):
+    #open a span, close it with end_span or use it in a with statement
+    if not profiler.enabled:
+        return NULL_SPAN
+    stack   = profiler.stack()
+    s       = Span(name,args,profiler.now(),threading.get_ident(),len(stack),stack[-1].name if len(stack) > 0 else None)
+    stack.append(s)
+    return s
+
+def end_span(s):
+    if s is NULL_SPAN or s.end is not None:
+        return
+    s.end   = profiler.now()
+    stack   = profiler.stack()
+    if s in stack:
+        stack.remove(s)
+    with profiler.lock:
+        profiler.spans.append(s)
+
+def profile_count(name,n=1):
+    #add n to a counter
+    if not profiler.enabled:
+        return
+    with profiler.lock:
+        profiler.counters[name] = profiler.counters.get(name,0) + n
+
+def profile_gauge(name,value):
+    #record the current value of a gauge
+    if not profiler.enabled:
+        return
+    with profiler.lock:
+        profiler.gauges.setdefault(name,list()).append((profiler.now(),value))
+
+def get_span_summary():
+    #number of calls, total, mean and max time of each span name
+    summary = {}
+    for s in profiler.spans:
+        d           = summary.setdefault(s.name,{'calls':0,'total':0.0,'max':0.0})
+        duration    = s.end - s.start
+        d['calls'] += 1
+        d['total'] += duration
+        d['max']    = max(d['max'],duration)
+    for d in summary.values():
+        d['mean'] = d['total'] / d['calls']
+    return summary
+
+def get_profile():
+    #the profile as a json-serializable dictionary
+    with profiler.lock:
+        spans = [{'name':s.name,'start':s.start,'duration':s.end - s.start,'tid':s.tid,'depth':s.depth,
+                  'parent':s.parent,'args':{k:str(v) for k,v in s.args.items()}} for s in profiler.spans]
+        return {'spans':sorted(spans,key=lambda s: s['start']),'summary':get_span_summary(),
+                'counters':dict(profiler.counters),'gauges':{k:list(v) for k,v in profiler.gauges.items()}}
+
+def write_profile_json(fname):
+    with open(fname,'w') as f:
+        json.dump(get_profile(),f,indent=1)
+
+def write_chrome_trace(fname):
+    #complete events for the spans and counter events for the gauges, times in microseconds
+    profile = get_profile()
+    pid     = os.getpid()
+    events  = list()
+    for s in profile['spans']:
+        events.append({'name':s['name'],'ph':'X','ts':s['start'] * 1e6,'dur':s['duration'] * 1e6,
+                       'pid':pid,'tid':s['tid'],'args':s['args']})
+    for name,values in profile['gauges'].items():
+        for t,value in values:
+            events.append({'name':name,'ph':'C','ts':t * 1e6,'pid':pid,'args':{'value':value}})
+    end     = max([s['start'] + s['duration'] for s in profile['spans']] + [0])
+    for name,value in profile['counters'].items():
+        events.append({'name':name,'ph':'C','ts':end * 1e6,'pid':pid,'args':{'value':value}})
+    with open(fname,'w') as f:
+        json.dump({'traceEvents':events,'displayTimeUnit':'ms'},f)
+
+def write_profile(prefix):
+    #the profile in both formats, prefix.json and prefix.trace.json
+    write_profile_json(prefix+'.json')
+    write_chrome_trace(prefix+'.trace.json')
+    for name,d in sorted(get_span_summary().items(),key=lambda x: -x[1]['total']):
+        logging.info('[info] profile %-24s %6s calls %10.4f s total %10.4f s max',name,d['calls'],d['total'],d['max'])
+    logging.info('[info] Profile written to %s.json and %s.trace.json',prefix,prefix)
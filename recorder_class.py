@@ -0,0 +1,95 @@
+'''
+Copyright © 2023 Prof. Anup Das
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+Author      : Anup Das
+Date        : July 02, 2023
+Version     : 2.0
+Description : This is the class definition of the event recorder. The pes and channels of a
+simulation record their events (task and transfer start and end) as tuples in a ring buffer
+instead of logging them, and the events are logged once the simulation is done. The trace
+level selects which events are recorded, nothing is recorded when it is off.
+'''
+
+import logging
+import logging.handlers
+import queue
+from collections import deque
+
+#verbosity of the event trace
+TRACE_OFF       = 0     #no events
+TRACE_TASKS     = 1     #pe and task start and end
+TRACE_TRANSFERS = 2     #and every mem and dma transfer
+TRACE_LEVELS    = {'off':TRACE_OFF,'tasks':TRACE_TASKS,'transfers':TRACE_TRANSFERS}
+
+#log line of each kind of event, filled with the resource, task, value and time
+EVENT_FORMATS = {
+    'pe_start'      : lambda r,t,v,c: 'Starting PE %s at time %s' % (r,c),
+    'task_start'    : lambda r,t,v,c: 'PE = %s, Starting task %s (extime = %s) at time %s' % (r,t,v,c),
+    'prefetch'      : lambda r,t,v,c: 'PE = %s, Prefetching inputs of task %s at time %s' % (r,t,c),
+    'task_end'      : lambda r,t,v,c: 'PE = %s, Ending task %s at time %s' % (r,t,c),
+    'transfer_start': lambda r,t,v,c: 'Task %s Start %s Transfer at %s on channel %s' % (t,r,c,v),
+    'transfer_end'  : lambda r,t,v,c: 'Task %s End %s Transfer at %s' % (t,r,c),
+    'weight_start'  : lambda r,t,v,c: 'Task %s Start %s Weight Transfer at %s on channel %s' % (t,r,c,v),
+    'weight_end'    : lambda r,t,v,c: 'Task %s End %s Weight Transfer at %s' % (t,r,c),
+}
+
+class EventRecorder:
+    """
+    Class to hold the events of one simulation. An event is a tuple (time, kind, resource,
+    task, value), the value is the execution time of a task start and the channel of a
+    transfer start. Appending to the deque is atomic, so the pe and channel threads record
+    without a lock
+    """
+    def __init__(self,level='off',capacity=None):
+        if level not in TRACE_LEVELS:
+            logging.error('[error] unknown trace level %s, expected one of %s',level,list(TRACE_LEVELS.keys()))
+            exit()
+        self.level      = TRACE_LEVELS[level]
+        self.tasks      = self.level >= TRACE_TASKS         #record the pe and task events
+        self.transfers  = self.level >= TRACE_TRANSFERS     #record the transfer events
+        self.events     = deque(maxlen=capacity)            #the oldest events are dropped when full
+
+    def record(self,time,kind,resource,task=None,value=None):
+        self.events.append((time,kind,resource,task,value))
+
+    def clear(self):
+        self.events.clear()
+
+    def is_full(self):
+        return self.events.maxlen is not None and len(self.events) == self.events.maxlen
+
+    def get_events(self):
+        #events sorted by time, the threads of the threaded engine append them out of order
+        return sorted(self.events,key=lambda e: e[0])
+
+def format_event(e):
+    time,kind,resource,task,value = e
+    return EVENT_FORMATS[kind](resource,task,value,time)
+
+def log_events(recorder,model_name):
+    #log the recorded events, after the simulation so that logging does not slow it down
+    if recorder.level == TRACE_OFF:
+        return
+    for e in recorder.get_events():
+        logging.info('[info] %s',format_event(e))
+    if recorder.is_full():
+        logging.info('[info] Trace buffer of %s model is full, older events may have been dropped',model_name)
+
+def start_log_listener(handlers,format,datefmt):
+    #the root logger puts the records in a queue, and a background thread writes them to the
+    #handlers, so that a slow file or terminal does not block the flow. Stop the listener at exit
+    log_queue   = queue.Queue(-1)
+    formatter   = logging.Formatter(format,datefmt=datefmt)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    listener    = logging.handlers.QueueListener(log_queue,*handlers,respect_handler_level=True)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))   #the handlers add the time
+    logging.basicConfig(level=logging.INFO,handlers=[queue_handler])
+    listener.start()
+    return listener
@@ -9,27 +9,59 @@ THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR I
 Author      : Anup Das
 Date        : July 02, 2023
 Version     : 2.0
-Description : This is the class definition of a schedule.
+Description : This is the class definition of a schedule. The transfers of a schedule are held
+as arrays, and a stage derives its schedule from the one of the previous stage without copying
+the fields it does not change.
 '''
 
+import numpy as np
+
 class Schedule:
     """
-    Class to hold a schedule
+    Class to hold a schedule. The add_ methods replace a field instead of changing it, and
+    the transfers are read-only, so a schedule can share its fields with the schedules
+    derived from it
     """
-    ex_start_times  = {}
-    ex_end_times    = {}
-    batch_delays    = list()
-    dma_times       = list()
-    mem_times       = list()
-
-    mapping         = list()
+    __slots__ = ['ex_start_times','ex_end_times','batch_delays','dma_times','mem_times',
+                 'mapping','solver_info','channel_occupancy','bounds','runtime','comm_actors']
 
-    def __init__(self,N):
+    def __init__(self,N=0):
         self.ex_start_times     = {}
         self.ex_end_times       = {}
-        self.dma_times          = list()
-        self.mem_times          = list()
+        self.batch_delays       = list()
+        self.dma_times          = TransferTable()
+        self.mem_times          = TransferTable()
         self.mapping            = list()
+        self.solver_info        = list()
+        self.channel_occupancy  = {}
+        self.bounds             = {}
+        self.runtime            = None      #wall time of the stage in seconds
+        self.comm_actors        = {}        #row of dma_times of each communication actor of IPCSchd
+
+    def __getstate__(self):
+        return {key:getattr(self,key) for key in Schedule.__slots__}
+
+    def __setstate__(self,state):
+        #pickles of earlier versions hold the instance dictionary, with the transfers as lists
+        #of MemorySchedule and without the fields that kept their class default
+        if isinstance(state,tuple):
+            state = state[1]
+        self.__init__()
+        for key in Schedule.__slots__:
+            if key in state:
+                setattr(self,key,state[key])
+        self.add_dma_times(self.dma_times)
+        self.add_mem_times(self.mem_times)
+
+    def derive(self):
+        #new schedule that shares all fields with this one, until they are replaced. The solver
+        #records and the runtime belong to the stage that made this schedule and are not shared
+        s = Schedule.__new__(Schedule)
+        for key in Schedule.__slots__:
+            setattr(s,key,getattr(self,key))
+        s.solver_info   = list()
+        s.runtime       = None
+        return s
 
     def add_ex_start_times(self,ex_start_times):
         self.ex_start_times = ex_start_times
@@ -41,14 +73,45 @@ class Schedule:
         self.batch_delays = delay_times
 
     def add_dma_times(self,dma_times):
-        self.dma_times = dma_times
+        self.dma_times = dma_times if isinstance(dma_times,TransferTable) else TransferTable(dma_times)
 
     def add_mem_times(self,mem_times):
-        self.mem_times = mem_times
+        self.mem_times = mem_times if isinstance(mem_times,TransferTable) else TransferTable(mem_times)
 
     def add_mapping(self,mapping):
         self.mapping = mapping
 
+    def add_solver_info(self,solver_info):
+        self.solver_info = solver_info
+
+    def add_channel_occupancy(self,channel_occupancy):
+        self.channel_occupancy = channel_occupancy
+
+    def add_bounds(self,bounds):
+        self.bounds = bounds
+
+    def add_runtime(self,runtime):
+        self.runtime = runtime
+
+    def add_comm_actors(self,comm_actors):
+        self.comm_actors = comm_actors
+
+    def get_gap(self):
+        #relative gap of the completion time to its lower bound, None if no bounds are known
+        bound = self.bounds.get('lower_bound',0)
+        if bound <= 0:
+            return None
+        return (self.get_completion_time() - bound) / bound
+
+    def get_channel_utilization(self):
+        #fraction of the schedule each dma and mem channel is busy
+        end_times       = list(self.ex_end_times.values())
+        max_end_time    = max(end_times) if len(end_times) > 0 else 0
+        utilization     = {}
+        for kind in self.channel_occupancy.keys():
+            utilization[kind] = [busy / max_end_time if max_end_time > 0 else 0 for busy in self.channel_occupancy[kind]]
+        return utilization
+
     def get_completion_time(self):
         end_times       = list(self.ex_end_times.values())
         max_end_time    = max(end_times)
@@ -60,22 +123,91 @@ class Schedule:
             return batch_end_time / (len(self.batch_delays) + 1)
 
 class MemorySchedule:
-    task        = None
-    start_time  = None
-    end_time    = None
+    """
+    Class to hold one transfer while it is simulated
+    """
+    __slots__ = ['task','start_time','end_time','channel']
 
     def __init__(self,task):
-        self.task       = task
+        self.task       = task      #header {'src':task, 'dst':task}
         self.start_time = None
         self.end_time   = None
+        self.channel    = None
+
+    def __getstate__(self):
+        return {key:getattr(self,key) for key in MemorySchedule.__slots__}
+
+    def __setstate__(self,state):
+        #pickles of earlier versions hold the instance dictionary
+        if isinstance(state,tuple):
+            state = state[1]
+        for key in MemorySchedule.__slots__:
+            setattr(self,key,state.get(key))
 
     def set_start_time(self,start_time):
         self.start_time = start_time
     def set_end_time(self,end_time):
         self.end_time = end_time
+    def set_channel(self,channel):
+        self.channel = channel
     def get_task(self):
         return self.task
     def get_start_time(self):
         return self.start_time
     def get_end_time(self):
-        self.end_time
+        return self.end_time
+
+class TransferTable:
+    """
+    Class to hold the dma or mem transfers of a schedule as read-only arrays. A source,
+    destination or channel of -1 stands for none. Indexing and iterating give MemorySchedule
+    objects, as in the list of transfers the simulation produces
+    """
+    __slots__ = ['src','dst','start','end','channel']
+
+    def __init__(self,transfers=()):
+        transfers       = list(transfers)
+        self.src        = to_array([-1 if tx.task['src'] is None else tx.task['src'] for tx in transfers])
+        self.dst        = to_array([-1 if tx.task['dst'] is None else tx.task['dst'] for tx in transfers])
+        self.start      = to_array([tx.start_time for tx in transfers])
+        self.end        = to_array([tx.end_time for tx in transfers])
+        self.channel    = to_array([-1 if tx.channel is None else tx.channel for tx in transfers])
+
+    def __getstate__(self):
+        return {key:getattr(self,key) for key in TransferTable.__slots__}
+
+    def __setstate__(self,state):
+        if isinstance(state,tuple):
+            state = state[1]
+        for key in TransferTable.__slots__:
+            array = np.array(state[key])
+            array.flags.writeable = False
+            setattr(self,key,array)
+
+    def __len__(self):
+        return len(self.src)
+
+    def __getitem__(self,i):
+        src,dst,start,end,channel = [getattr(self,key)[i].item() for key in TransferTable.__slots__]
+        tx = MemorySchedule({'src':None if src < 0 else src,'dst':None if dst < 0 else dst})
+        tx.set_start_time(start)
+        tx.set_end_time(end)
+        tx.set_channel(None if channel < 0 else channel)
+        return tx
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def rows(self):
+        #(src, dst, start time, end time, channel) of each transfer, with None for -1
+        for src,dst,start,end,channel in zip(*[getattr(self,key).tolist() for key in TransferTable.__slots__]):
+            yield (None if src < 0 else src,None if dst < 0 else dst,start,end,None if channel < 0 else channel)
+
+def to_array(values):
+    #read-only array of int64 values, or float64 if any value is fractional
+    array = np.array(values) if len(values) > 0 else np.zeros(0,dtype=np.int64)
+    if array.dtype.kind not in 'if':
+        array = array.astype(np.float64)
+    array.flags.writeable = False
+    return array
@@ -0,0 +1,215 @@
+'''
+Copyright © 2023 Prof. Anup Das
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+Author      : Anup Das
+Date        : July 02, 2023
+Version     : 2.0
+Description : This is the columnar trace of the schedules. Every task execution and every dma
+and mem transfer of a schedule is a row of the arrays actor, kind, resource, start, end, src and
+dst. The rows of each stage are written in chunks as the stages finish, to .npz files or, if
+pyarrow is installed, to row groups of a Parquet file, next to an index.json. The loader reads
+only the stages and columns asked for, and the trace can be exported for chrome://tracing or
+Perfetto.
+'''
+
+import json
+import logging
+import os
+import pickle
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from bounds import get_pe_key
+
+TRACE_VERSION   = 2
+KINDS           = ['compute','dma','mem','transfer']   #kind of a row, stored as its index, transfer is a communication actor of IPCSchd
+COLUMNS         = ['actor','kind','resource','start','end','src','dst']
+
+def get_schedule_columns(schd):
+    #the rows of a schedule. The actor of a transfer is the task whose tensor it moves, or the
+    #task whose weights it loads, src and dst are -1 for none. The communication actors of
+    #IPCSchd are transfer rows on the channel of their dma transfer
+    pe_keys     = {m['task']:get_pe_key(m) for m in schd.mapping}
+    tasks       = list(schd.ex_start_times.keys())
+    dma         = schd.dma_times
+    rows        = [schd.comm_actors.get(t,-1) for t in tasks]   #dma row of each communication actor
+    src         = [dma.src[r] if r >= 0 else -1 for r in rows]
+    dst         = [dma.dst[r] if r >= 0 else -1 for r in rows]
+    actor       = [(s if s >= 0 else d) if r >= 0 else t for t,r,s,d in zip(tasks,rows,src,dst)]
+    kind        = [3 if r >= 0 else 0 for r in rows]
+    resource    = ['dma_'+str(max(dma.channel[r],0)) if r >= 0 else pe_keys.get(t,'') for t,r in zip(tasks,rows)]
+    start       = [schd.ex_start_times[t] for t in tasks]
+    end         = [schd.ex_end_times.get(t,schd.ex_start_times[t]) for t in tasks]
+    columns     = {'actor':[np.array(actor,dtype=np.int64)],'kind':[np.array(kind,dtype=np.int8)],
+                   'resource':[np.array(resource,dtype=np.str_)],'start':[np.array(start,dtype=np.float64)],
+                   'end':[np.array(end,dtype=np.float64)],'src':[np.array(src,dtype=np.int64)],
+                   'dst':[np.array(dst,dtype=np.int64)]}
+    for k,times in ((1,schd.dma_times),(2,schd.mem_times)):     #the columns of the transfer tables
+        columns['actor'].append(np.where(times.src < 0,times.dst,times.src))
+        columns['kind'].append(np.full(len(times),k,dtype=np.int8))
+        columns['resource'].append(np.char.add(KINDS[k]+'_',np.maximum(times.channel,0).astype(np.str_)))
+        columns['start'].append(times.start)
+        columns['end'].append(times.end)
+        columns['src'].append(times.src)
+        columns['dst'].append(times.dst)
+    dtypes      = {'actor':np.int64,'kind':np.int8,'resource':np.str_,'start':np.float64,'end':np.float64,'src':np.int64,'dst':np.int64}
+    return {name:np.concatenate(arrays).astype(dtypes[name]) for name,arrays in columns.items()}
+
+class TraceWriter:
+    """
+    Class to write the rows of the stages of a flow as they are produced. The trace is a
+    directory with an index.json and the chunks of rows, each chunk belongs to one stage
+    """
+    def __init__(self,path,chunk_rows=65536,format=None):
+        if format is None:
+            format = 'npz' if pa is None else 'parquet'
+        if format == 'parquet' and pa is None:
+            logging.error('[error] the parquet trace format needs pyarrow')
+            exit()
+        if format not in ['npz','parquet']:
+            logging.error('[error] unknown trace format %s, expected npz or parquet',format)
+            exit()
+        os.makedirs(path,exist_ok=True)
+        self.path       = path
+        self.chunk_rows = chunk_rows        #rows per chunk, the largest array written at once
+        self.format     = format
+        self.chunks     = list()            #file, stage and number of rows of each chunk
+        self.meta       = {}                #completion time and other values of each stage
+        self.writer     = None              #parquet writer, opened with the first chunk
+
+    def write_stage(self,stage,schd):
+        self.meta[stage] = {'completion_time':schd.get_completion_time()}
+        self.write(stage,get_schedule_columns(schd))
+
+    def write(self,stage,columns):
+        n_rows = len(columns['actor'])
+        for first in range(0,n_rows,self.chunk_rows):
+            chunk = {name:columns[name][first:first + self.chunk_rows] for name in COLUMNS}
+            self.write_chunk(stage,chunk)
+
+    def write_chunk(self,stage,chunk):
+        n_rows = len(chunk['actor'])
+        if self.format == 'npz':
+            fname = 'chunk_%05d.npz' % len(self.chunks)
+            np.savez(os.path.join(self.path,fname),**chunk)
+        else:
+            fname = 'trace.parquet'
+            table = pa.table(dict(chunk,stage=pa.array([stage] * n_rows)))
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(os.path.join(self.path,fname),table.schema)
+            self.writer.write_table(table)
+        self.chunks.append({'file':fname,'stage':stage,'rows':n_rows})
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        index = {'version':TRACE_VERSION,'format':self.format,'columns':COLUMNS,'kinds':KINDS,
+                 'chunks':self.chunks,'stages':self.meta}
+        with open(os.path.join(self.path,'index.json'),'w') as f:
+            json.dump(index,f,indent=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+        return False
+
+def write_trace(path,schedule_dict,chunk_rows=65536,format=None):
+    #columnar trace of the schedules of all stages
+    with TraceWriter(path,chunk_rows,format) as writer:
+        for stage,schd in schedule_dict.items():
+            writer.write_stage(stage,schd)
+    logging.info('[info] Trace of %s stages written to %s',len(schedule_dict),path)
+
+def load_trace_index(path):
+    with open(os.path.join(path,'index.json')) as f:
+        index = json.load(f)
+    if index['version'] > TRACE_VERSION:       #earlier versions only lack kinds
+        logging.error('[error] trace %s has version %s, expected at most %s',path,index['version'],TRACE_VERSION)
+        exit()
+    return index
+
+def load_trace(path,stages=None,columns=None):
+    #arrays of the columns of the rows of the stages, all of them if None, and the stage of each row
+    index       = load_trace_index(path)
+    columns     = COLUMNS if columns is None else columns
+    chunks      = [c for c in index['chunks'] if stages is None or c['stage'] in stages]
+    trace       = {name:list() for name in columns}
+    trace['stage'] = list()
+    if index['format'] == 'npz':
+        for c in chunks:
+            with np.load(os.path.join(path,c['file']),allow_pickle=False) as data:
+                for name in columns:
+                    trace[name].append(data[name])
+            trace['stage'].append(np.full(c['rows'],c['stage']))
+    elif len(chunks) > 0:
+        if pa is None:
+            logging.error('[error] reading the parquet trace %s needs pyarrow',path)
+            exit()
+        filters = None if stages is None else [('stage','in',list(stages))]
+        table   = pq.read_table(os.path.join(path,'trace.parquet'),columns=columns + ['stage'],filters=filters)
+        return {name:table.column(name).to_numpy() for name in columns + ['stage']}
+    return {name:np.concatenate(arrays) if len(arrays) > 0 else np.array([]) for name,arrays in trace.items()}
+
+def get_event_name(kind,actor,src):
+    if kind == 0:
+        return 'task '+str(actor)
+    return ('weights ' if src < 0 else 'tensor ')+str(actor)
+
+def export_chrome_trace(path,fname,stages=None):
+    #gantt chart of the trace, one process per stage and one thread per pe or channel. The
+    #times are cycles, shown as microseconds
+    index       = load_trace_index(path)
+    trace       = load_trace(path,stages)
+    stage_names = [s for s in index['stages'].keys() if stages is None or s in stages]
+    events      = list()
+    threads     = {}                        #(stage, resource) -> tid
+    for pid,stage in enumerate(stage_names):
+        events.append({'name':'process_name','ph':'M','pid':pid,'args':{'name':stage}})
+        events.append({'name':'process_sort_index','ph':'M','pid':pid,'args':{'sort_index':pid}})
+    pids        = {stage:pid for pid,stage in enumerate(stage_names)}
+    for i in range(len(trace['actor'])):
+        stage       = str(trace['stage'][i])
+        resource    = str(trace['resource'][i])
+        kind        = int(trace['kind'][i])
+        if (stage,resource) not in threads:
+            threads[(stage,resource)] = len(threads)
+            events.append({'name':'thread_name','ph':'M','pid':pids[stage],'tid':threads[(stage,resource)],'args':{'name':resource}})
+        events.append({'name':get_event_name(kind,int(trace['actor'][i]),int(trace['src'][i])),'cat':KINDS[kind],'ph':'X',
+                       'ts':float(trace['start'][i]),'dur':float(trace['end'][i] - trace['start'][i]),
+                       'pid':pids[stage],'tid':threads[(stage,resource)],
+                       'args':{'src':int(trace['src'][i]),'dst':int(trace['dst'][i])}})
+    with open(fname,'w') as f:
+        json.dump({'traceEvents':events,'displayTimeUnit':'ms'},f)
+    logging.info('[info] Chrome trace of %s events written to %s',len(events),fname)
+
+if __name__ == "__main__":
+    #Arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-pkl','--pkl',default=None,help='pickled schedules of main.py to convert to a trace')
+    parser.add_argument('-trace','--trace',required=True,help='trace directory')
+    parser.add_argument('-format','--format',default=None,choices=['npz','parquet'],help='parquet if pyarrow is installed, npz otherwise')
+    parser.add_argument('-chrome','--chrome',default=None,help='export the trace to this json for chrome://tracing or Perfetto')
+    parser.add_argument('-stages','--stages',nargs='+',default=None,help='stages to export, all if not set')
+    args = vars(parser.parse_args())
+
+    format = "[%(asctime)s]: %(message)s"
+    logging.basicConfig(format=format, level=logging.INFO,datefmt="%H:%M:%S")
+
+    if args['pkl'] is not None:
+        write_trace(args['trace'],pickle.load(open(args['pkl'],'rb')),format=args['format'])
+    if args['chrome'] is not None:
+        export_chrome_trace(args['trace'],args['chrome'],args['stages'])
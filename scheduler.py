@@ -21,8 +21,8 @@ import pickle
 import numpy as np
 import random
 
-#Global Parameters
-import globals
+#Simulation State
+from context_class import *
 
 #Configuration Parameters
 from params import *
@@ -33,65 +33,156 @@ from schedule_class import *
 
 #Resource Definition
 from nsoc_resource import *
+from event_resource import *
 
-def list_scheduler(g,sg,task_map,model_name):
+def get_par_ste_order(sg,task_map):
+    resource_map    = (list(set(['cpu' if m['resource'] == 'cpu' else m['resource']+'_'+str(m['tile'])+'_'+m['name'] for m in task_map])))    #different types of resource used
+    par_ste_order   = {}  #create order for parallel resources
+    for resmap in resource_map:
+        par_ste_order[resmap] = list()  #create empty orders for each source
+    for to in sg:                       #create the order for each task from the ste order
+        resmap_to  = task_map[to]['resource']   #get the resource for the task
+        tilemap_to = str(task_map[to]['tile'])  #get the tile for the task
+        layermap_to= task_map[to]['name']       #get the name for the task
+        if resmap_to == 'cpu':                  #if the resource is cpu
+            key = 'cpu'                         #the key is cpu
+        else:                                   #else
+            key = resmap_to + '_' + tilemap_to + '_' + layermap_to  #key is resource_tile
+        par_ste_order[key].append(to)           #add the task to the order
+    return par_ste_order
+
+def get_channel_occupancy(transfers,n_channels):
+    #busy cycles of each channel, transfers without a channel ran on channel 0
+    occupancy = [0] * n_channels
+    for tx in transfers:
+        channel = 0 if tx.channel is None else tx.channel
+        occupancy[channel] += tx.end_time - tx.start_time
+    return occupancy
+
+def set_task_priority(ctx,g):
+    #transfers of a task are arbitrated by its critical path length
+    if ctx.cfg['channel_arbitration'] == 'priority':
+        ctx.task_priority = get_critical_path_lengths(g)
+
+def add_channel_occupancy(s,ctx):
+    s.add_channel_occupancy({'dma':get_channel_occupancy(ctx.dma_times,ctx.cfg['n_dma_channels']),
+                             'mem':get_channel_occupancy(ctx.mem_times,ctx.cfg['n_mem_channels'])})
+
+def set_pinned_spm(ctx,g,task_map):
+    #the prefetch only uses the spm left by the pinned tensors and weights, once per schedule
+    if ctx.cfg['pe_prefetch']:
+        ctx.spm_pinned = get_pinned_spm(ctx.cfg,g,task_map)
+
+def log_prefetch(ctx,model_name):
+    if ctx.cfg['pe_prefetch']:
+        logging.info('[info] Inputs of %s tasks of %s model were prefetched before the tasks were dispatched',len(ctx.prefetched_tasks),model_name)
+
+def log_prefetch_gain(schd,base_schd,model_name,stage):
+    #throughput gain of the prefetch, from the completion time of the same mapping without it
+    with_time       = schd.get_completion_time()
+    without_time    = base_schd.get_completion_time()
+    gain            = without_time / with_time - 1 if with_time > 0 else 0
+    logging.info('[info] Prefetch of %s model (%s): completion time %s cycles with prefetch, %s without, throughput gain %.2f%%',model_name,stage,with_time,without_time,100 * gain)
+    return gain
+
+def list_scheduler(g,sg,task_map,model_name,engine='thread',cfg=None,ctx=None):
+    if ctx is None:                     #each schedule owns its simulation state
+        ctx = SimulationContext(cfg)
+    if engine == 'event':
+        with profile_span('event_scheduler',model=model_name):
+            return event_scheduler(g,sg,task_map,model_name,ctx)
+    elif engine != 'thread':
+        logging.error('[error] unknown scheduling engine %s',engine)
+        exit()
     ###############################
     #initialize local variables
     ###############################
     start_time      = time.time()       #start a timer
+    span            = profile_span('thread_scheduler',model=model_name)
     n_tasks         = len(task_map)     #number of tasks
     s               = Schedule(n_tasks) #create an empty schedule
     run             = True              #run variable
     compute_threads = list()            #list of threads
     tensor_locs     = {}                #location of tensors as specified in the mapping
+    weight_locs     = {}                #location of weights as specified in the mapping
     ###############################
-    #initialize global variables
+    #initialize simulation state
     ###############################
-    globals.task_start_times= {}
-    globals.task_end_times  = {}
-    globals.dma_times       = list()
-    globals.mem_times       = list()
-    globals.cpu_cycles      = 0
-    #initialize the completion status
-    for key in g.dependency.keys():
-        globals.completion_status[key] = 0
+    ctx.reset(g.dependency.keys())      #clear the state and the completion status
+    set_task_priority(ctx,g)            #priorities of the channel arbitration
+    set_pinned_spm(ctx,g,task_map)      #spm taken by the pinned tensors and weights
 
     #extract the tensor locations
     for t in task_map:
         tensor_locs[t['task']] = t['tensor']
+        weight_locs[t['task']] = t.get('weight','mem')
     
-    resource_map    = (list(set(['cpu' if m['resource'] == 'cpu' else m['resource']+'_'+str(m['tile'])+'_'+m['name'] for m in task_map])))    #different types of resource used
-    par_ste_order   = {}  #create order for parallel resources
-    for resmap in resource_map:
-        par_ste_order[resmap] = list()  #create empty orders for each source
-    for to in sg:                       #create the order for each task from the ste order
-        resmap_to  = task_map[to]['resource']   #get the resource for the task
-        tilemap_to = str(task_map[to]['tile'])  #get the tile for the task
-        layermap_to= task_map[to]['name']       #get the name for the task
-        if resmap_to == 'cpu':                  #if the resource is cpu
-            key = 'cpu'                         #the key is cpu
-        else:                                   #else
-            key = resmap_to + '_' + tilemap_to + '_' + layermap_to  #key is resource_tile
-        par_ste_order[key].append(to)           #add the task to the order
+    par_ste_order   = get_par_ste_order(sg,task_map)  #create order for parallel resources
     for key in par_ste_order.keys():            #for each pe resource
-        thread = threading.Thread(target=pe, args=(g,key,par_ste_order[key],tensor_locs,))    #define the thread
+        thread = threading.Thread(target=pe, args=(ctx,g,key,par_ste_order[key],tensor_locs,weight_locs,))    #define the thread
         compute_threads.append(thread)          #append the thread to the list of threads
         thread.start()                          #start the pe thread
+    profile_gauge('thread_scheduler.pe_threads',len(compute_threads))
     while run:
-        all_task_status = list(globals.completion_status.values())  #get status of all tasks
+        all_task_status = list(ctx.completion_status.values())      #get status of all tasks
         if 0 not in all_task_status:
             run = False
-        time.sleep(usec)
-        globals.cpu_cycles += 1
+        time.sleep(ctx.cfg['usec'])
+        ctx.cpu_cycles += 1
 
-    s.add_ex_start_times(globals.task_start_times)      #add ex start times
-    s.add_ex_end_times(globals.task_end_times)          #add ex end times
-    s.add_dma_times(globals.dma_times)                  #add dma times
-    s.add_mem_times(globals.mem_times)                  #add mem times
+    s.add_ex_start_times(ctx.task_start_times)          #add ex start times
+    s.add_ex_end_times(ctx.task_end_times)              #add ex end times
+    s.add_dma_times(ctx.dma_times)                      #add dma times
+    s.add_mem_times(ctx.mem_times)                      #add mem times
     s.add_mapping(task_map)                             #add the resources
+    add_channel_occupancy(s,ctx)                        #add busy cycles of each channel
+    log_prefetch(ctx,model_name)                        #number of tasks with prefetched inputs
+    log_events(ctx.recorder,model_name)                 #events of the simulation, if traced
     #wait for 1 sec
     time.sleep(1)
+    profile_count('thread_scheduler.cpu_cycles',ctx.cpu_cycles)
+    end_span(span)
     elapsed_time    = time.time() - start_time          #elapsed time
     logging.info('[info] List scheduling of %s model took %s seconds',model_name,elapsed_time)
 
     return s
+
+def event_scheduler(g,sg,task_map,model_name,ctx):
+    ###############################
+    #initialize local variables
+    ###############################
+    start_time      = time.time()       #start a timer
+    n_tasks         = len(task_map)     #number of tasks
+    s               = Schedule(n_tasks) #create an empty schedule
+    tensor_locs     = {}                #location of tensors as specified in the mapping
+    weight_locs     = {}                #location of weights as specified in the mapping
+
+    #extract the tensor locations
+    for t in task_map:
+        tensor_locs[t['task']] = t['tensor']
+        weight_locs[t['task']] = t.get('weight','mem')
+
+    par_ste_order   = get_par_ste_order(sg,task_map)  #create order for parallel resources
+    ctx.reset(g.dependency.keys())                    #clear the state and the completion status
+    set_task_priority(ctx,g)                          #priorities of the channel arbitration
+    set_pinned_spm(ctx,g,task_map)                    #spm taken by the pinned tensors and weights
+    engine          = EventEngine(ctx,g,tensor_locs,weight_locs)  #discrete-event model of the pes and channels
+    engine.run(par_ste_order)                         #simulate until no events are left
+    profile_count('event_scheduler.events',engine.eq.seq)
+
+    n_incomplete    = list(ctx.completion_status.values()).count(0)
+    if n_incomplete > 0:
+        logging.error('[error] Event scheduling of %s model deadlocked with %s tasks not completed',model_name,n_incomplete)
+
+    s.add_ex_start_times(ctx.task_start_times)        #add ex start times
+    s.add_ex_end_times(ctx.task_end_times)            #add ex end times
+    s.add_dma_times(ctx.dma_times)                    #add dma times
+    s.add_mem_times(ctx.mem_times)                    #add mem times
+    s.add_mapping(task_map)                           #add the resources
+    add_channel_occupancy(s,ctx)                      #add busy cycles of each channel
+    log_prefetch(ctx,model_name)                      #number of tasks with prefetched inputs
+    log_events(ctx.recorder,model_name)               #events of the simulation, if traced
+    elapsed_time    = time.time() - start_time        #elapsed time
+    logging.info('[info] Event scheduling of %s model took %s seconds',model_name,elapsed_time)
+
+    return s
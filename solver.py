@@ -0,0 +1,141 @@
+'''
+Copyright © 2023 Prof. Anup Das
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+Author      : Anup Das
+Date        : July 02, 2023
+Version     : 2.0
+Description : This is the solver layer of the ILP stages of SMART (OpMap, ActMap, IPCSchd). The
+solver, time limit, MIP gap, threads and verbosity can be set globally or per stage, and every
+solve is reported with the solver that produced it and the time it took. A solve whose result
+cannot be used is reported as failed, and the stage falls back to its heuristic.
+'''
+#Headers
+import logging
+import time
+import pulp
+from pulp import LpStatus, LpSolution, LpSolutionOptimal, LpSolutionIntegerFeasible
+
+#Configuration Parameters
+from params import *
+
+#Profiler
+from profiler import *
+
+#solvers tried, in this order, when the configured solver is 'auto' or not available
+SOLVER_PREFERENCE   = ['gurobi','highs','cbc']
+
+#pulp solver classes of each solver, python api first
+SOLVER_CLASSES      = {
+    'gurobi'    : ['GUROBI','GUROBI_CMD'],
+    'highs'     : ['HiGHS','HiGHS_CMD'],
+    'cbc'       : ['PULP_CBC_CMD'],
+}
+
+#stages that run their heuristic when the solver is 'auto' and gurobi is not available, the
+#OpMap ILP does not finish on large models with cbc or highs
+AUTO_HEURISTIC_STAGES = ['opmap']
+
+available_solvers   = None  #pulp solver names available on this machine, filled on first use
+reported_fallbacks  = set() #solvers whose fallback has been logged
+
+def get_solver_options(cfg,stage):
+    #global solver settings overridden by the settings of the stage
+    options = {
+        'solver'    : cfg['solver'],
+        'time_limit': cfg['solver_time_limit'],
+        'mip_gap'   : cfg['solver_mip_gap'],
+        'threads'   : cfg['solver_threads'],
+        'msg'       : cfg['solver_msg'],
+    }
+    options.update(cfg['solver_stages'].get(stage,{}))
+    return options
+
+def get_solver_class(name):
+    #first pulp solver class of a solver that is available, None if there is none
+    global available_solvers
+    if available_solvers is None:
+        available_solvers = pulp.listSolvers(onlyAvailable=True)
+    for cls in SOLVER_CLASSES[name]:
+        if cls in available_solvers:
+            return cls
+    return None
+
+def resolve_solver(name):
+    #returns (solver, pulp solver class), falling back to the first available solver
+    if name == 'heuristic':
+        return name,None
+    if name != 'auto':
+        if name not in SOLVER_CLASSES:
+            logging.error('[error] unknown solver %s',name)
+            exit()
+        cls = get_solver_class(name)
+        if cls is not None:
+            return name,cls
+    for fallback in SOLVER_PREFERENCE:
+        cls = get_solver_class(fallback)
+        if cls is not None:
+            if name != 'auto' and name not in reported_fallbacks:
+                logging.info('[info] Solver %s is not available, using %s',name,fallback)
+                reported_fallbacks.add(name)
+            return fallback,cls
+    logging.error('[error] no ILP solver is available, use the heuristic solver')
+    exit()
+
+def get_solver(stage,cfg):
+    #solver name of a stage, 'heuristic' means the stage runs its own pure-python method
+    requested   = get_solver_options(cfg,stage)['solver']
+    name,_      = resolve_solver(requested)
+    if requested == 'auto' and name != 'gurobi' and stage in AUTO_HEURISTIC_STAGES:
+        if stage not in reported_fallbacks:
+            logging.info('[info] Gurobi is not available, %s uses its heuristic (set solver to %s to run the ILP)',stage,name)
+            reported_fallbacks.add(stage)
+        return 'heuristic'
+    return name
+
+def record_solve(stage,solver,status,elapsed,report=None):
+    info = {'stage':stage,'solver':solver,'status':status,'time':elapsed}
+    logging.info('[info] %s solved by %s in %s seconds (status %s)',stage,solver,elapsed,status)
+    if report is not None:
+        report.append(info)
+    return info
+
+def solve(model,stage,cfg,report=None,warm_start=False):
+    options     = get_solver_options(cfg,stage)
+    name,cls    = resolve_solver(options['solver'])
+    kwargs      = {'msg':options['msg']}
+    if options['time_limit'] is not None:
+        kwargs['timeLimit'] = options['time_limit']
+    if options['mip_gap'] is not None:
+        kwargs['gapRel']    = options['mip_gap']
+    if options['threads'] is not None:
+        kwargs['threads']   = options['threads']
+    if warm_start:
+        kwargs['warmStart'] = True
+    profile_gauge(stage+'.variables',model.numVariables())
+    profile_gauge(stage+'.constraints',model.numConstraints())
+    profile_count(stage+'.solves')
+    start_time  = time.time()
+    with profile_span('solve',stage=stage,solver=name):
+        status  = model.solve(getattr(pulp,cls)(**kwargs))
+    elapsed     = time.time() - start_time
+    info        = record_solve(stage,name,LpStatus[status],elapsed,report)
+    info['solution'] = LpSolution[model.sol_status]
+    info['accepted'] = is_solved(model)
+    return info
+
+def is_solved(model):
+    #the values of a solve are used if it is optimal, or if it stopped at the time limit with a
+    #feasible incumbent, and every variable has a value
+    if model.sol_status not in [LpSolutionOptimal,LpSolutionIntegerFeasible]:
+        return False
+    return all([var.value() is not None for var in model.variables()])
+
+def record_fallback(info,fallback,elapsed,report=None):
+    #a failed solve is replaced by the heuristic of the stage, both are in the report
+    logging.info('[error] %s solve by %s failed (status %s, %s), falling back to %s',info['stage'],info['solver'],info['status'],info['solution'],fallback)
+    return record_solve(info['stage'],fallback,'Fallback',elapsed,report)
@@ -0,0 +1,190 @@
+'''
+Copyright © 2023 Prof. Anup Das
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+Author      : Anup Das
+Date        : July 02, 2023
+Version     : 2.0
+Description : This is a design-space sweep over hardware configurations. Each point of a grid
+(or of a random sample of the grid) is run through the full SMART flow for each model, each in
+its own process, and the completion times of all stages are written to one results table.
+'''
+#Headers
+import logging
+import time
+import csv
+import ast
+import random
+import itertools
+import os
+import pickle
+import multiprocessing
+from multiprocessing.connection import wait
+
+#Configuration Parameters
+from params import *
+
+#Helper fns
+from helper_fns import *
+
+#Import the design flow
+import SMART
+from cache_class import *
+
+STAGES = ['steuni','opmap','actmap','stepar','ipcschd','parschd']
+
+def parse_grid(grid_args):
+    #each argument is of the form key=v1,v2,...
+    grid = {}
+    for arg in grid_args:
+        key,values  = arg.split('=',1)
+        grid[key]   = [ast.literal_eval(v) for v in values.split(',')]
+    get_params({key:values[0] for key,values in grid.items()})   #fail early on unknown parameters
+    return grid
+
+def get_points(grid,n_samples=0,seed=0):
+    keys    = list(grid.keys())
+    points  = [dict(zip(keys,values)) for values in itertools.product(*[grid[key] for key in keys])]
+    if n_samples > 0 and n_samples < len(points):    #random sample of the grid
+        points = random.Random(seed).sample(points,n_samples)
+    return points
+
+def run_point(model_name,overrides,engine,cache_dir=None,timeout=None,ofname=None):
+    #runs the flow for one model and configuration and saves the schedules to ofname if given.
+    #The time limit in seconds is enforced by run_isolated, here it only caps the solvers
+    row = {'model':model_name}
+    row.update(overrides)
+    start_time = time.time()
+    try:
+        cfg             = get_params(overrides)
+        if timeout is not None and cfg['solver_time_limit'] is None:
+            cfg['solver_time_limit'] = timeout      #a solver process must not outlive the point
+        cache           = StageCache(cache_dir) if cache_dir is not None else None    #stages shared by several points are computed once
+        g               = read_graph_data(model_name)
+        schedule_dict   = SMART.SMARTFlow(g,model_name,cfg,engine,cache=cache)
+        if ofname is not None:
+            pickle.dump(schedule_dict,open(ofname,'wb'))
+        for stage in STAGES:
+            row[stage]  = schedule_dict[stage].get_completion_time()
+        for stage in STAGES:
+            row[stage+'_gap'] = schedule_dict[stage].get_gap()
+        for stage in STAGES:
+            row[stage+'_runtime'] = schedule_dict[stage].runtime     #wall time of the stage, with its list scheduling
+        for stage in ['opmap','actmap','ipcschd']:
+            solver_info = schedule_dict[stage].solver_info
+            row[stage+'_solver']        = ','.join(sorted(set([info['solver'] for info in solver_info])))
+            row[stage+'_solve_time']    = sum([info['time'] for info in solver_info])
+        row['status']   = 'ok'
+    except BaseException as e:      #a failing point must not stop the sweep
+        row['status']   = 'error: '+repr(e)
+    row['runtime'] = time.time() - start_time
+    return row
+
+def run_worker(conn,job):
+    #process of one point, sends its row back to run_isolated
+    conn.send(run_point(*job))
+    conn.close()
+
+def get_status_row(job,status,runtime):
+    #row of a point that did not return one
+    row = {'model':job[0]}
+    row.update(job[1])
+    row['status']   = status
+    row['runtime']  = runtime
+    return row
+
+def stop_process(p):
+    p.terminate()
+    p.join(5)
+    if p.is_alive():            #did not stop on SIGTERM
+        p.kill()
+        p.join()
+
+def run_isolated(jobs,workers=None,timeout=None):
+    #runs each job, a tuple of the arguments of run_point, in its own process, at most workers
+    #at a time. A process that outlives the timeout is terminated, and a process that crashes
+    #only loses its own point. Yields the index of each job and its row as they finish
+    workers = os.cpu_count() if workers is None else workers
+    pending = list(range(len(jobs)))
+    running = {}                #index -> (process, connection, start time)
+    while len(pending) > 0 or len(running) > 0:
+        while len(pending) > 0 and len(running) < workers:
+            i           = pending.pop(0)
+            recv,send   = multiprocessing.Pipe(duplex=False)
+            p           = multiprocessing.Process(target=run_worker,args=(send,jobs[i]))
+            p.start()
+            send.close()        #only the worker writes to the pipe
+            running[i]  = (p,recv,time.time())
+        wait([recv for p,recv,start in running.values()] + [p.sentinel for p,recv,start in running.values()],
+             timeout=None if timeout is None else 1.0)
+        for i,(p,recv,start) in list(running.items()):
+            runtime = time.time() - start
+            row     = None
+            if recv.poll():
+                try:
+                    row = recv.recv()
+                    p.join()
+                except EOFError:    #the worker died before it sent its row
+                    p.join()
+                    row = get_status_row(jobs[i],'error: worker exited with code '+str(p.exitcode),runtime)
+            elif not p.is_alive():
+                row = get_status_row(jobs[i],'error: worker exited with code '+str(p.exitcode),runtime)
+            elif timeout is not None and runtime > timeout:
+                stop_process(p)
+                row = get_status_row(jobs[i],'timeout',runtime)
+            if row is not None:
+                recv.close()
+                del running[i]
+                yield i,row
+
+def sweep(models,points,engine='event',workers=None,cache_dir=None,timeout=None):
+    rows = list()
+    jobs = [(model_name,overrides,engine,cache_dir,timeout) for model_name in models for overrides in points]
+    for n,(i,row) in enumerate(run_isolated(jobs,workers,timeout)):
+        logging.info('[info] Sweep point %s/%s done: %s',n+1,len(jobs),row)
+        rows.append(row)
+    return rows
+
+def write_table(rows,ofname):
+    fieldnames = list()
+    for row in rows:
+        for key in row.keys():
+            if key not in fieldnames:
+                fieldnames.append(key)
+    with open(ofname,'w',newline='') as f:
+        writer = csv.DictWriter(f,fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+if __name__ == "__main__":
+    #Arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-models','--models',nargs='+',default=['resnet50'])
+    parser.add_argument('-grid','--grid',nargs='+',default=['n_tiles=2,4,8'],help='parameter values as key=v1,v2,...')
+    parser.add_argument('-samples','--samples',type=int,default=0,help='number of random points of the grid, 0 for the full grid')
+    parser.add_argument('-seed','--seed',type=int,default=0)
+    parser.add_argument('-workers','--workers',type=int,default=None)
+    parser.add_argument('-engine','--engine',default='event',choices=['thread','event'])
+    parser.add_argument('-out','--out',default='results/sweep.csv')
+    parser.add_argument('-cache','--cache',default=None,help='stage cache directory, no cache if not set')
+    parser.add_argument('-timeout','--timeout',type=float,default=None,help='time limit of a point in seconds')
+    parser.add_argument('-fname','--fname',default='sweep.log')
+    args = vars(parser.parse_args())
+
+    format = "[%(asctime)s]: %(message)s"
+    handlers = [logging.FileHandler(args['fname']), logging.StreamHandler()]
+    logging.basicConfig(format=format, level=logging.INFO,datefmt="%H:%M:%S",handlers = handlers)
+
+    start_time  = time.time()
+    grid        = parse_grid(args['grid'])
+    points      = get_points(grid,args['samples'],args['seed'])
+    logging.info('[info] Sweeping %s configurations over %s models',len(points),len(args['models']))
+    rows        = sweep(args['models'],points,args['engine'],args['workers'],args['cache'],args['timeout'])
+    write_table(rows,args['out'])
+    elapsed     = time.time() - start_time
+    logging.info('[info] Sweep of %s points took %s seconds, results written to %s',len(rows),elapsed,args['out'])
@@ -0,0 +1,192 @@
+'''
+Copyright © 2023 Prof. Anup Das
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+Author      : Anup Das
+Date        : July 02, 2023
+Version     : 2.0
+Description : This is the synthetic model generator. It writes model directories in the format
+of read_graph_data (graph.txt, extime.pkl, tensors.pkl, weights.pkl, layer_types.pkl and
+layer_names.txt) for families of graphs: chains, residual blocks, inception-style fan-out and
+transformer blocks, of any number of nodes.
+'''
+#Headers
+import logging
+import os
+import pickle
+import random
+import numpy as np
+
+FAMILIES = ['chain','residual','inception','transformer']
+
+#npu execution time per tensor element of each layer type, and the range of the cpu slowdown.
+#layer types the npu does not support only get a cpu time that matters
+EXTIME_PER_ELEMENT = {
+    'InputLayer'            : 0.05,
+    'Conv2D'                : 0.12,
+    'DepthwiseConv2D'       : 0.08,
+    'BatchNormalization'    : 0.10,
+    'Activation'            : 0.04,
+    'Add'                   : 0.05,
+    'Concatenate'           : 0.03,
+    'MaxPooling2D'          : 0.10,
+    'Dense'                 : 0.15,
+    'Dot'                   : 0.12,
+    'Softmax'               : 0.06,
+    'LayerNormalization'    : 0.08,
+}
+CPU_SLOWDOWN = (1.1,2.0)
+
+#weights per layer type, (min, max) size, 0 for layers without weights
+WEIGHTS = {
+    'Conv2D'                : (64,512),
+    'DepthwiseConv2D'       : (16,128),
+    'BatchNormalization'    : (256,256),
+    'Dense'                 : (512,4096),
+    'LayerNormalization'    : (256,256),
+}
+
+TENSOR_SIZES = [1024,2048,4096,8192,16384]
+
+class ModelBuilder:
+    """
+    Class to build a model graph node by node, with the attributes read_graph_data expects
+    """
+    def __init__(self,seed=0):
+        self.rng        = random.Random(seed)
+        self.edges      = list()    #(src, dst)
+        self.ltypes     = list()    #layer type of each node
+        self.names      = list()    #layer name of each node
+        self.tensors    = list()    #output tensor size of each node
+        self.weights    = list()    #weight size of each node
+
+    def __len__(self):
+        return len(self.ltypes)
+
+    def add(self,ltype,inputs,tensor=None):
+        #add a node with edges from inputs, returns its id
+        u = len(self.ltypes)
+        if tensor is None:
+            tensor = self.tensors[inputs[0]] if len(inputs) > 0 else self.rng.choice(TENSOR_SIZES)
+        low,high = WEIGHTS.get(ltype,(0,0))
+        self.ltypes.append(ltype)
+        self.names.append(ltype.lower()+'_'+str(u))
+        self.tensors.append(int(tensor))
+        self.weights.append(self.rng.randint(low,high))
+        for v in inputs:
+            self.edges.append((v,u))
+        return u
+
+    def get_extime(self,u):
+        npu = self.tensors[u] * EXTIME_PER_ELEMENT[self.ltypes[u]] * self.rng.uniform(0.8,1.2)
+        return {'npu':npu, 'cpu':npu * self.rng.uniform(*CPU_SLOWDOWN)}
+
+def chain_block(b,x):
+    x = b.add('Conv2D',[x],b.rng.choice(TENSOR_SIZES))
+    x = b.add('BatchNormalization',[x])
+    return b.add('Activation',[x])
+
+def residual_block(b,x):
+    y = b.add('Conv2D',[x])
+    y = b.add('BatchNormalization',[y])
+    y = b.add('Activation',[y])
+    y = b.add('Conv2D',[y])
+    y = b.add('BatchNormalization',[y])
+    y = b.add('Add',[x,y])
+    return b.add('Activation',[y])
+
+def inception_block(b,x):
+    branches = [b.add('Conv2D',[x],b.tensors[x] // 4)]
+    y = b.add('Conv2D',[x],b.tensors[x] // 4)
+    branches.append(b.add('Conv2D',[y]))
+    y = b.add('Conv2D',[x],b.tensors[x] // 4)
+    y = b.add('Conv2D',[y])
+    branches.append(b.add('Conv2D',[y]))
+    y = b.add('MaxPooling2D',[x])
+    branches.append(b.add('Conv2D',[y],b.tensors[x] // 4))
+    return b.add('Concatenate',branches,sum([b.tensors[u] for u in branches]))
+
+def transformer_block(b,x):
+    y = b.add('LayerNormalization',[x])
+    q = b.add('Dense',[y])
+    k = b.add('Dense',[y])
+    v = b.add('Dense',[y])
+    s = b.add('Dot',[q,k])
+    s = b.add('Softmax',[s])
+    y = b.add('Dot',[s,v])
+    y = b.add('Dense',[y])
+    x = b.add('Add',[x,y])
+    y = b.add('LayerNormalization',[x])
+    y = b.add('Dense',[y],b.tensors[y] * 4)
+    y = b.add('Activation',[y])
+    y = b.add('Dense',[y],b.tensors[x])
+    return b.add('Add',[x,y])
+
+BLOCKS = {
+    'chain'         : (chain_block,3),
+    'residual'      : (residual_block,7),
+    'inception'     : (inception_block,10),
+    'transformer'   : (transformer_block,14),
+}
+
+def generate_model(family,n_nodes,seed=0):
+    #builder with exactly n_nodes nodes: an input layer, blocks of the family, and a chain of
+    #activations for the nodes left over
+    if family not in BLOCKS:
+        logging.error('[error] unknown model family %s, expected one of %s',family,FAMILIES)
+        exit()
+    if n_nodes < 2:
+        logging.error('[error] a model needs at least 2 nodes')
+        exit()
+    block,block_size = BLOCKS[family]
+    b = ModelBuilder(seed)
+    x = b.add('InputLayer',[],b.rng.choice(TENSOR_SIZES))
+    while len(b) + block_size <= n_nodes:
+        x = block(b,x)
+    while len(b) < n_nodes:
+        x = b.add('Activation',[x])
+    return b
+
+def write_model(b,model_name,model_root='models'):
+    #write the model in the format of read_graph_data
+    model_dir = os.path.join(model_root,model_name)
+    os.makedirs(model_dir,exist_ok=True)
+    np.savetxt(os.path.join(model_dir,'graph.txt'),np.array(b.edges,dtype=np.int64).reshape(-1,2),fmt='%d')
+    pickle.dump([b.get_extime(u) for u in range(len(b))],open(os.path.join(model_dir,'extime.pkl'),'wb'))
+    pickle.dump({u:t for u,t in enumerate(b.tensors)},open(os.path.join(model_dir,'tensors.pkl'),'wb'))
+    pickle.dump({u:w for u,w in enumerate(b.weights)},open(os.path.join(model_dir,'weights.pkl'),'wb'))
+    pickle.dump({u:l for u,l in enumerate(b.ltypes)},open(os.path.join(model_dir,'layer_types.pkl'),'wb'))
+    with open(os.path.join(model_dir,'layer_names.txt'),'w') as f:
+        f.write('\n'.join(b.names)+'\n')
+    logging.info('[info] Wrote %s model with %s nodes and %s edges to %s',model_name,len(b),len(b.edges),model_dir)
+
+def get_synth_name(family,n_nodes,seed=0):
+    return 'synth_'+family+'_'+str(n_nodes)+('' if seed == 0 else '_s'+str(seed))
+
+def make_model(family,n_nodes,seed=0,model_root='models'):
+    #name of the generated model, it is written only if it does not exist yet
+    model_name = get_synth_name(family,n_nodes,seed)
+    if not os.path.exists(os.path.join(model_root,model_name,'graph.txt')):
+        write_model(generate_model(family,n_nodes,seed),model_name,model_root)
+    return model_name
+
+if __name__ == "__main__":
+    #Arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-families','--families',nargs='+',default=FAMILIES,choices=FAMILIES)
+    parser.add_argument('-sizes','--sizes',nargs='+',type=int,default=[100,1000,10000])
+    parser.add_argument('-seed','--seed',type=int,default=0)
+    parser.add_argument('-root','--root',default='models',help='directory of the model directories')
+    args = vars(parser.parse_args())
+
+    format = "[%(asctime)s]: %(message)s"
+    logging.basicConfig(format=format, level=logging.INFO,datefmt="%H:%M:%S")
+
+    for family in args['families']:
+        for n_nodes in args['sizes']:
+            write_model(generate_model(family,n_nodes,args['seed']),get_synth_name(family,n_nodes,args['seed']),args['root'])